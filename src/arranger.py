@@ -0,0 +1,210 @@
+__author__ = 'Alastair Kerr'
+
+import bisect
+import itertools
+
+from placement import Placement
+import eval, eval3c
+import scorer
+
+# Row win values against a random opponent row, built on first use by buildRowValueTables
+FIVE_CARD_ROW_VALUES = None
+THREE_CARD_ROW_VALUES = None
+
+
+def buildRowValueTables():
+    """
+    Works out, for every 5 and 3 card strength, P(win) - P(lose) against a uniformly random hand of the same size
+    Hand counts per strength come from the evaluators' rank multiset tables, so no hands are enumerated
+    :return: None
+    """
+    global FIVE_CARD_ROW_VALUES, THREE_CARD_ROW_VALUES
+
+    fiveCounts = {}
+    for ranks in itertools.combinations_with_replacement(range(0, 13), 5):
+        if ranks[0] == ranks[4]:
+            continue
+        key = 1
+        combos = 1
+        for r in set(ranks):
+            combos *= len(list(itertools.combinations(range(0, 4), ranks.count(r))))
+        for r in ranks:
+            key *= eval.RANK_PRIMES[r]
+        if len(set(ranks)) == 5:
+            # 4 of the 4^5 suit combinations are flushes
+            combos -= 4
+            strength = eval.FLUSH_STRENGTHS[key]
+            fiveCounts[strength] = fiveCounts.get(strength, 0) + 4
+        strength = eval.UNSUITED_STRENGTHS[key]
+        fiveCounts[strength] = fiveCounts.get(strength, 0) + combos
+
+    threeCounts = {}
+    for ranks in itertools.combinations_with_replacement(range(0, 13), 3):
+        combos = 1
+        for r in set(ranks):
+            combos *= len(list(itertools.combinations(range(0, 4), ranks.count(r))))
+        strength = eval3c.STRENGTHS[eval3c.RANK_PRIMES[ranks[0]] * eval3c.RANK_PRIMES[ranks[1]] * eval3c.RANK_PRIMES[ranks[2]]]
+        threeCounts[strength] = threeCounts.get(strength, 0) + combos
+
+    FIVE_CARD_ROW_VALUES = rowValues(fiveCounts)
+    THREE_CARD_ROW_VALUES = rowValues(threeCounts)
+
+def rowValues(counts):
+    """
+    :param counts: Dict strength -> number of hands with that strength
+    :return: Dict strength -> (hands beaten - hands lost to) / total hands
+    """
+    total = float(sum(counts.values()))
+    values = {}
+    below = 0
+    for strength in sorted(counts):
+        above = total - below - counts[strength]
+        values[strength] = (below - above) / total
+        below += counts[strength]
+    return values
+
+
+class Arrangement(object):
+    def __init__(self, bottom, middle, top, discards, value, royalties):
+        """
+        Result of arrange - the chosen rows plus any cards left out
+        :return: None
+        """
+        self.bottom = bottom
+        self.middle = middle
+        self.top = top
+        self.discards = discards
+        self.value = value          # Royalties plus expected row points against random opponent rows
+        self.royalties = royalties
+
+    def applyTo(self, placement):
+        """
+        Set this arrangement's rows on an empty Placement
+        :param placement: Placement object
+        :return: None
+        """
+        assert isinstance(placement, Placement)
+        placement.setRow(row='Bottom', cards=self.bottom)
+        placement.setRow(row='Middle', cards=self.middle)
+        placement.setRow(row='Top', cards=self.top)
+
+
+def arrange(cards):
+    """
+    Branch and bound search for the best non-fouling arrangement of 13 known cards (or 14-17 for fantasyland, where
+    the extra cards are discarded), maximising royalties plus expected row points against random opponent rows
+    Every 5 and 3 card subset is evaluated once up front; the search then walks bottoms and middles in descending value
+    order, bounding each row by the best subset that wouldn't foul against the row beneath it, and stops as soon as
+    that bound can't beat the best arrangement found so far
+    :param cards: List of 13-17 Card objects
+    :return: Arrangement object, or None if every arrangement fouls
+    """
+    assert 13 <= len(cards) <= 17
+    if FIVE_CARD_ROW_VALUES == None:
+        buildRowValueTables()
+
+    cards = list(cards)
+    n = len(cards)
+    full = (1 << n) - 1
+    shift = scorer.ROYALTY_INDEX_SHIFT
+    bottomRoyalties = scorer.ROYALTY_TABLES['Bottom']
+    middleRoyalties = scorer.ROYALTY_TABLES['Middle']
+    topRoyalties = scorer.ROYALTY_TABLES['Top']
+
+    # (value, strength, mask, royalties) for every subset, as bottom, middle and top candidates
+    bottoms = []
+    middles = []
+    for indices in itertools.combinations(range(0, n), 5):
+        strength = eval.strength_5_cards([cards[i] for i in indices])
+        mask = sum([1 << i for i in indices])
+        rowValue = FIVE_CARD_ROW_VALUES[strength]
+        b = bottomRoyalties[strength >> shift]
+        m = middleRoyalties[strength >> shift]
+        bottoms.append((b + rowValue, strength, mask, b))
+        middles.append((m + rowValue, strength, mask, m))
+    tops = []
+    for indices in itertools.combinations(range(0, n), 3):
+        strength = eval3c.strength_3_cards([cards[i] for i in indices])
+        royalty = topRoyalties[strength >> shift]
+        tops.append((royalty + THREE_CARD_ROW_VALUES[strength], strength, sum([1 << i for i in indices]), royalty))
+
+    # Royalties and row values both rise with strength, so sorting by value also sorts by strength - the best row
+    # that doesn't beat the row beneath it is found by bisecting the (negated) strengths
+    bottoms.sort(reverse=True)
+    middles.sort(reverse=True)
+    tops.sort(reverse=True)
+    topKeys = [-t[1] for t in tops]
+    topsByMask = dict([(t[2], t) for t in tops])
+
+    # Each middle's bound is its value plus the best top it could sit above, with that top's index in tops
+    middleKeys = []
+    middleBounds = []
+    for middle in middles:
+        topFirst = bisect.bisect_left(topKeys, -middle[1])
+        middleKeys.append(-middle[1])
+        middleBounds.append((middle[0] + tops[topFirst][0] if topFirst < len(tops) else float('-inf'), topFirst))
+
+    best = None
+    bestValue = float('-inf')
+    for bottom in bottoms:
+        first = bisect.bisect_left(middleKeys, -bottom[1])
+        if first == len(middles):
+            continue
+        if bottom[0] + middleBounds[first][0] <= bestValue:
+            # Weaker bottoms only lower the bound further
+            break
+
+        for index in xrange(first, len(middles)):
+            middle = middles[index]
+            if middle[2] & bottom[2]:
+                continue
+            bound, topFirst = middleBounds[index]
+            if bottom[0] + bound <= bestValue:
+                break
+
+            used = bottom[2] | middle[2]
+            if n == 13:
+                # The top row is whatever is left
+                top = topsByMask[full ^ used]
+                if top[1] > middle[1]:
+                    continue
+            else:
+                top = None
+                for candidate in tops[topFirst:]:
+                    if bottom[0] + middle[0] + candidate[0] <= bestValue:
+                        break
+                    if not candidate[2] & used:
+                        top = candidate
+                        break
+                if top == None:
+                    continue
+
+            value = bottom[0] + middle[0] + top[0]
+            if value > bestValue:
+                bestValue = value
+                best = (bottom, middle, top)
+
+    if best == None:
+        return None
+
+    bottom, middle, top = best
+    used = bottom[2] | middle[2] | top[2]
+    rowCards = lambda mask: [cards[i] for i in range(0, n) if mask & (1 << i)]
+    return Arrangement(bottom=rowCards(bottom[2]), middle=rowCards(middle[2]), top=rowCards(top[2]),
+                       discards=rowCards(full ^ used), value=bestValue,
+                       royalties=bottom[3] + middle[3] + top[3])
+
+
+if __name__ == "__main__":
+    # Testing functionality - arrange 13 and 17 random cards
+    import time
+    from deck import Deck
+
+    for count in [13, 17]:
+        cards = Deck().deal_n(count)
+        start = time.time()
+        a = arrange(cards)
+        print "%i cards arranged in %.1fms" % (count, (time.time() - start) * 1000)
+        print "Bottom %s, middle %s, top %s, discards %s: value %.2f, royalties %i" % \
+              ("".join([c.card for c in a.bottom]), "".join([c.card for c in a.middle]),
+               "".join([c.card for c in a.top]), "".join([c.card for c in a.discards]), a.value, a.royalties)
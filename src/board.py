@@ -6,18 +6,41 @@ from card import Card
 
 
 class Board(object):
-    def __init__(self, playerCount=2, deck=None, deckPointer=0):
+    def __init__(self, playerCount=2, deck=None, deckPointer=0, seed=None, stream=0, placementsLoader=None):
         """
         Initialise board object composed of Player objects for each player and a Deck object
+        :param seed: Seed for the deck's shuffle (see Deck)
+        :param stream: Stream number within the seed, e.g. the round number
+        :param placementsLoader: Function called with the new placements list when it is first built,
+                                 used to hydrate placements only if something reads them
         :return: None
         """
         assert isinstance(playerCount, int)
         assert 2 <= playerCount <= 4
 
         self.playerCount = playerCount
-        self.deck = Deck(deck=deck, currentPosition=deckPointer)
+        self.deck = Deck(deck=deck, currentPosition=deckPointer, seed=seed, stream=stream)
 
-        self.placements = self.initPlacements()
+        self.placementsLoader = placementsLoader
+        self._placements = None
+
+    @property
+    def placements(self):
+        """
+        List of Placement objects, one per player - built on first use
+        :return: List of Placement objects
+        """
+        if (self._placements == None):
+            self._placements = self.initPlacements()
+            if (self.placementsLoader != None):
+                self.placementsLoader(self._placements)
+        return self._placements
+
+    def placementsLoaded(self):
+        """
+        :return: True if the placements have been built (anything not built can't have changed)
+        """
+        return self._placements != None
 
     def initPlacements(self):
         """
@@ -0,0 +1,113 @@
+__author__ = 'Alastair Kerr'
+
+import itertools
+
+from card import Card
+from placement import Placement
+
+# Every relabelling of the 4 suits, as tuples mapping old suit index -> new suit index
+SUIT_PERMUTATIONS = tuple(itertools.permutations(range(0, 4)))
+
+# RELABEL[p][cardId] = card id after applying SUIT_PERMUTATIONS[p] (card id = rank index * 4 + suit index)
+RELABEL = tuple([tuple([(cardId & ~3) | perm[cardId & 3] for cardId in range(0, 52)])
+                 for perm in SUIT_PERMUTATIONS])
+
+
+def invertSuitMap(suitMap):
+    """
+    Inverts a suit mapping
+    :param suitMap: Tuple mapping old suit index -> new suit index
+    :return: Tuple mapping new suit index -> old suit index
+    """
+    inverse = [0] * 4
+    for old, new in enumerate(suitMap):
+        inverse[new] = old
+    return tuple(inverse)
+
+def relabelCards(cards, suitMap):
+    """
+    Applies a suit mapping to a list of cards (None entries, i.e. empty slots, are kept as None)
+    Use the inverse mapping from canonicalise to translate cards in a cached decision back to the real suits
+    :param cards: List of Card objects
+    :param suitMap: Tuple mapping old suit index -> new suit index
+    :return: List of Card objects
+    """
+    relabelled = []
+    for c in cards:
+        if c == None:
+            relabelled.append(None)
+        else:
+            relabelled.append(Card((c & ~3) | suitMap[c & 3]))
+    return relabelled
+
+def cardGroups(placement, cards=[], opponentPlacements=[]):
+    """
+    Splits a board into unordered groups of card ids - positions within a row and the order cards were dealt don't matter
+    :param placement: Placement object for the player
+    :param cards: List of Card objects dealt to the player but not yet placed
+    :param opponentPlacements: List of Placement objects for visible opponent boards, in seat order
+    :return: List of lists of card ids
+    """
+    groups = []
+    for p in [placement] + list(opponentPlacements):
+        assert isinstance(p, Placement)
+        for row in [p.bottomRow, p.middleRow, p.topRow]:
+            groups.append([c for c in row.cardPlacements if c != None])
+    groups.append(list(cards))
+    return groups
+
+def canonicaliseGroups(groups):
+    """
+    Finds the suit relabelling giving the lexicographically smallest key for the given card groups
+    All 24 relabellings are tried, so any two boards equal up to a suit permutation get the same key
+    :param groups: List of lists of card ids
+    :return: (key, suitMap, inverseSuitMap) - key is a hashable tuple of sorted tuples of card ids
+    """
+    bestKey = None
+    bestIndex = 0
+    for index in range(0, len(RELABEL)):
+        table = RELABEL[index]
+        key = tuple([tuple(sorted([table[c] for c in group])) for group in groups])
+        if bestKey == None or key < bestKey:
+            bestKey = key
+            bestIndex = index
+
+    suitMap = SUIT_PERMUTATIONS[bestIndex]
+    return bestKey, suitMap, invertSuitMap(suitMap)
+
+def canonicalise(placement, cards=[], opponentPlacements=[]):
+    """
+    Maps a player's placement, unplaced cards and (optionally) the visible opponent boards to a canonical key
+    Boards which only differ by a permutation of suits are strategically identical and share a key,
+    so caches keyed on it (placements, EV results) hit up to 24x more often
+    :param placement: Placement object for the player
+    :param cards: List of Card objects dealt to the player but not yet placed
+    :param opponentPlacements: List of Placement objects for visible opponent boards, in seat order
+    :return: (key, suitMap, inverseSuitMap) - relabel cards with suitMap to reach the canonical board,
+             and relabel a cached canonical decision with inverseSuitMap to apply it to the real board
+    """
+    return canonicaliseGroups(cardGroups(placement, cards, opponentPlacements))
+
+def canonicaliseCards(cards):
+    """
+    Canonical key for an unordered set of cards, e.g. for evaluation caches
+    :param cards: List of Card objects
+    :return: (key, suitMap, inverseSuitMap) - key is a sorted tuple of card ids
+    """
+    key, suitMap, inverse = canonicaliseGroups([cards])
+    return key[0], suitMap, inverse
+
+
+if __name__ == "__main__":
+    # Testing functionality - the same board in two different suits gives one key
+    p1 = Placement(playerNumber=1)
+    p1.setRow(row='Bottom', cards=[Card('AH'), Card('KH')])
+    p1.setRow(row='Top', cards=[Card('QS')])
+    p2 = Placement(playerNumber=1)
+    p2.setRow(row='Bottom', cards=[Card('AD'), Card('KD')])
+    p2.setRow(row='Top', cards=[Card('QC')])
+
+    key1, suitMap1, inverse1 = canonicalise(p1, cards=[Card('2H')])
+    key2, suitMap2, inverse2 = canonicalise(p2, cards=[Card('2D')])
+    print key1 == key2, key1
+    print [c.card for c in relabelCards([Card(c) for c in key2[-1]], inverse2)]
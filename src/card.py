@@ -1,16 +1,55 @@
 __author__ = 'Alastair Kerr'
 
-class Card(object):
-    def __init__(self, card="AH"):
+RANKS = '23456789TJQKA'
+SUITS = 'HDSC'
+
+# Card id = rank index * 4 + suit index, e.g. 2H -> 0, 2D -> 1, AC -> 51
+CARD_STRINGS = tuple([rank + suit for rank in RANKS for suit in SUITS])
+
+
+class Card(int):
+    """
+    Playing card stored as an int id 0-51 (see CARD_STRINGS)
+    Cards are interned, so Card('AH') always returns the same object; the two char string is only a view
+    """
+    __slots__ = ()
+
+    def __new__(cls, card="AH"):
+        """
+        Look up the interned card for a card string (e.g. 'AH') or card id (0-51)
+        :return: Card object
+        """
+        try:
+            return CARDS[card]
+        except (KeyError, TypeError):
+            if isinstance(card, basestring) and card.upper() in CARDS:
+                return CARDS[card.upper()]
+            raise ValueError("Invalid card: %r" % (card,))
+
+    @property
+    def card(self):
         """
-        Initialise card
-        :return: None
+        :return: 2 char card string <rank><suit> e.g. 'AH'
         """
-        assert isinstance(card, basestring)
-        assert len(card) == 2
-        assert card[0].upper() in ['2', '3', '4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
-        assert card[1].upper() in ['H', 'S', 'D', 'C']
+        return CARD_STRINGS[self]
+
+    @property
+    def rank(self):
+        """
+        :return: Rank char e.g. 'A'
+        """
+        return RANKS[self >> 2]
+
+    @property
+    def suit(self):
+        """
+        :return: Suit char e.g. 'H'
+        """
+        return SUITS[self & 3]
+
 
-        self.card = str(card)
-        self.rank = str(card[0])
-        self.suit = str(card[1])
+# Interned card objects looked up by id or by string
+CARDS = {}
+for cardId in range(0, 52):
+    CARDS[cardId] = CARDS[CARD_STRINGS[cardId]] = int.__new__(Card, cardId)
+del cardId
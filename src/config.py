@@ -11,7 +11,8 @@ cherrypy_config = {
             'log.access_file': os.path.abspath(os.path.join(os.path.dirname(__file__), '%s/cherrypy-access.log' % LOGS_DIR)),
             'log.error_file': os.path.abspath(os.path.join(os.path.dirname(__file__), '%s/cherrypy-error.log' % LOGS_DIR)),
             'server.socket_host': '0.0.0.0',
-            'server.socket_port': 8080
+            'server.socket_port': 8080,
+            'server.thread_pool': 10
         },
     '/':
         {
@@ -38,6 +39,52 @@ cherrypy_config = {
         }
 }
 
+# Stored game state format - 'binary' (gameStateCodec, needs the BLOB game_state column - run
+# migrate_database.py on older databases) or 'literal' (str(dict)). Reads detect either format
+game_state_encoding = 'binary'
+
+# Store games as an append-only log of per-action events in the game_events table, with a full snapshot every
+# SNAPSHOT_INTERVAL events, instead of overwriting game_state in the games table (see gameEventLog)
+# With a write behind cache in front, actions coalesced into one flush are logged as a single event
+event_log_config = {
+    'ENABLED': False,
+    'SNAPSHOT_INTERVAL': 20,
+}
+
+# In-process cache of game states in front of the database (see gameStateCache)
+game_state_cache_config = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 10000,
+    'TTL': 600,             # Seconds before a cached game is re-read from the database
+    # Write changed games from a background thread instead of on every request. Requests are then confirmed before
+    # the game is stored, so a crash loses up to FLUSH_INTERVAL of writes - off (write through) unless opted in
+    'WRITE_BEHIND': False,
+    'FLUSH_INTERVAL': 0.5,  # Most seconds a changed game waits to be written
+}
+
+# Game storage (see storage_backends) - 'mysql' (database_config below), 'sqlite' (a local file in WAL mode, no
+# database server needed) or 'memory' (nothing persisted - for tests and benchmarks)
+storage_backend = 'mysql'
+
+sqlite_config = {
+    'PATH': os.path.abspath(os.path.join(os.path.dirname(__file__), 'ofc.sqlite')),
+}
+
+# Database connection pool (see storage_backends.ConnectionPool) - sized to server.thread_pool above
+database_pool_config = {
+    'TIMEOUT': 30,          # Most seconds a request waits for a free connection
+    'IDLE_TIMEOUT': 300,    # Seconds before an idle connection is closed
+    'PING_AFTER': 30,       # Seconds idle before a connection is checked on reuse
+}
+
+# Group commit (see storage_backends.BatchWriter) - concurrent game state writes wait up to MAX_DELAY seconds to
+# share one multi-row upsert, trading that much latency per write for far fewer transactions under load
+database_batch_config = {
+    'ENABLED': False,
+    'MAX_DELAY': 0.005,
+    'MAX_BATCH': 100,
+}
+
 # Test config
 database_config = {
     'HOST': '172.18.47.11',
@@ -1,117 +1,158 @@
 __author__ = "Alastair Kerr"
 
-import MySQLdb
-
 import config
-import tools
+import gameStateCodec
+import storage_backends
+from storage_backends import ConnectionPool, PoolTimeout, BatchWriter
 
 
 class Database(object):
     """
     Middle-man between server and database handling requests
-    Reads and writes entries for games as required
+    Reads and writes entries for games as required, through the storage backend chosen in config
     """
-    def __init__(self):
+    def __init__(self, pool_size=None, backend=None, batched=None):
         """
-        Initialise database settings from config
+        Initialise the storage backend from config (see storage_backends)
+        SQL backends share a connection pool, sized by default to the CherryPy thread pool so every request thread
+        can hold a connection
+        :param pool_size: Most open connections (defaults to config)
+        :param backend: Storage backend name ('mysql', 'sqlite' or 'memory') or object (defaults to config)
+        :param batched: True to group commit concurrent writes (see BatchWriter - defaults to config)
         """
-        self.HOST = config.database_config['HOST']
-        self.PORT = config.database_config['PORT']
-        self.USER = config.database_config['USER']
-        self.PASS = config.database_config['PASS']
-        self.DB = config.database_config['DB']
-
-    def execute_query(self, query):
+        if backend == None or isinstance(backend, basestring):
+            backend = storage_backends.create_backend(backend, pool_size)
+        self.backend = backend
+
+        batch_config = config.database_batch_config
+        if batched == None:
+            batched = batch_config['ENABLED']
+        self.batch_writer = None
+        if batched:
+            self.batch_writer = BatchWriter(backend, max_delay=batch_config['MAX_DELAY'],
+                                            max_batch=batch_config['MAX_BATCH'])
+
+    def execute_query(self, query, params=None, rowcount=False):
         """
-        Connects to database and executes given query
-        :param query: string SQL query
+        Executes given query on the storage backend (SQL backends only)
+        :param query: string SQL query, with %s placeholders for any params
+        :param params: Tuple of values for the placeholders, escaped by the driver
+        :param rowcount: True to return the number of rows changed instead of the rows fetched
         :return: Result of query
         """
-        db = MySQLdb.connect(host=self.HOST,
-                             port=self.PORT,
-                             user=self.USER,
-                             passwd=self.PASS,
-                             db=self.DB)
-        db.autocommit(True)
-
-        cur = db.cursor()
-        try:
-            cur.execute(query)
-            result = cur.fetchall()
-        except Exception, e:
-            db.close()
-            error = "%s: %s" % (tools.get_formatted_datetime(), e)
-            tools.write_error("There was an error executing an SQL query!")
-            tools.write_error(error + "\n")
-            return error
-
-        db.close()
-        return result
-
-    def build_query(self, query, *params):
-        """
-        Perform basic sanitisation to avoid SQL injection and build full query
-        :param query: Query with %s for any params
-        :param params: List of values to insert into query
-        :return: String query
-        """
-        for param in params:
-            assert ';' not in param
-        final = query % (params)
-        return final
+        return self.backend.execute_query(query, params, rowcount)
+
+    def check_schema(self):
+        """
+        Checks the storage backend's schema is one this version can write to (see the backends' check_schema)
+        Raises RuntimeError if it needs migrating
+        :return: None
+        """
+        self.backend.check_schema()
+
+    def pool_stats(self):
+        """
+        :return: Dict of storage backend metrics (connection pool metrics for SQL backends, see ConnectionPool.stats)
+        """
+        return self.backend.stats()
 
     def query_by_game_id(self, game_id, column=None):
         """
         Query database entry for a given game_id
         Specify a column (e.g. game_state) or defaults to pulling entire row
+        Works on every storage backend (the memory backend has no timestamps, so returns None for them)
         :param game_id: uuid4
-        :param column: Column name or empty for *
-        :return: Result of query
+        :param column: Column name (see storage_backends.GAME_COLUMNS) or empty for *
+        :return: Tuple of matching rows, like a query result - empty if there is no game with that id
         """
         if not column:
             column = '*'
+        assert column == '*' or column in storage_backends.GAME_COLUMNS
 
-        query = self.build_query("SELECT %s FROM games WHERE game_id = \"%s\"", column, game_id)
-        result = self.execute_query(query)
-
-        return result
+        row = self.backend.get_row(str(game_id))
+        if row == None:
+            return ()
+        if column == '*':
+            return (row,)
+        return ((row[storage_backends.GAME_COLUMNS.index(column)],),)
 
     def get_game_state(self, game_id, sanitised=False):
         """
         Returns dictionary representation of the game state for the given game_id
         Set sanitised to True to get sanitised game_state for the frontend removing information such as the cards in the deck
+        (or the seed it is dealt from)
         :param game_id: str uuid4
         :return: Game state
         """
-        game_state_string = self.query_by_game_id(game_id, 'game_state')[0][0]
-        game_state = tools.load_dictionary_from_string(game_state_string)
-        if sanitised and 'deck' in game_state['gameState'].keys():
-            del game_state['gameState']['deck']
+        game_state_string = self.backend.get(str(game_id))
+        if game_state_string == None:
+            raise KeyError("No game with id '%s'" % game_id)
+        game_state = gameStateCodec.loadGameState(game_state_string)
+        if sanitised:
+            for key in ['deck', 'seed']:
+                if key in game_state['gameState'].keys():
+                    del game_state['gameState'][key]
 
         return game_state
 
+    def game_state_value(self, game_state):
+        """
+        Serialises a game state in the configured encoding (config.game_state_encoding), as a query parameter
+        :param game_state: dictionary with game state information (or an already serialised str(dict))
+        :return: str game state
+        """
+        if not isinstance(game_state, dict):
+            return game_state
+        if config.game_state_encoding == 'binary':
+            return gameStateCodec.encode(game_state)
+        return str(game_state)
+
     def update_game_state(self, game_id, game_state):
         """
         Update database entry for a given game - create new row if this doesn't already exist
+        One upsert keyed on the unique game_id, so there's no need to check whether the game exists first.
+        Each write bumps the row's version
         :param game_id: uuid for this game
         :param game_state: dictionary with game state information
         :return: Result of query
         """
-        gameExists = self.query_by_game_id(game_id)
+        if self.batch_writer != None:
+            return self.batch_writer.write(str(game_id), self.game_state_value(game_state))
+        return self.backend.upsert(str(game_id), self.game_state_value(game_state))
+
+    def update_game_states(self, game_states):
+        """
+        Writes several games at once in one multi-row upsert
+        :param game_states: List of (game_id, game state dict) tuples, at most one per game
+        :return: Result of query
+        """
+        return self.backend.upsert_many([(str(game_id), self.game_state_value(game_state))
+                                         for game_id, game_state in game_states])
 
-        if (gameExists):
-            query = "UPDATE games SET game_state = \"%s\" WHERE game_id = \"%s\""
-            query = self.build_query(query, game_state, game_id)
-        else:
-            query = "INSERT INTO games (game_id, game_state) VALUES (\"%s\", \"%s\");"
-            query = self.build_query(query, game_id, game_state)
+    def scan_game_states(self, after_id=0, limit=500):
+        """
+        Reads stored games in id order, a page at a time (e.g. for migrations and analysis)
+        :param after_id: Row id to start after (the last id of the previous page)
+        :param limit: Most rows to return
+        :return: List of (row id, game_id, stored game state) tuples
+        """
+        return self.backend.scan(after_id, limit)
+
+    def close(self):
+        """
+        Commits any batched writes and closes the storage backend's idle connections
+        :return: None
+        """
+        if self.batch_writer != None:
+            self.batch_writer.close()
+        self.backend.close()
 
-        result = self.execute_query(query)
-        return result
 
 if __name__ == "__main__":
-    # Testing database queries
-    db = Database()
-    params = ("\"asfasf-2325-fsaafa\"", "\"{'1':'x'}\"")
-    query = db.build_query("INSERT INTO games (game_id, game_state) VALUES (%s, %s);", params[0], params[1])
-    print db.execute_query(query)
+    # Testing database queries - on a throwaway SQLite database unless another backend is named
+    import sys
+    db = Database(backend=sys.argv[1] if len(sys.argv) > 1 else storage_backends.SQLiteBackend(':memory:', 1))
+    print db.update_game_state("asfasf-2325-fsaafa", "{'1':'x'}")
+    print db.update_game_state("asfasf-2325-fsaafa", "{'1':'y'}")
+    print db.query_by_game_id("asfasf-2325-fsaafa")
+    print db.scan_game_states(), db.pool_stats()
@@ -1,54 +1,96 @@
 __author__ = 'Alastair Kerr'
 
+import hashlib
 import random
 
-from card import Card
+from card import Card, RANKS, SUITS
+
+
+def seededRandom(seed, stream=0):
+    """
+    Independent random stream for a seed and stream number, e.g. a game's seed and the round number
+    Each stream is keyed by a hash of both, so streams never share state and any one can be regenerated on its own
+    :param seed: int or string seed
+    :param stream: int or string stream within the seed
+    :return: random.Random object
+    """
+    digest = hashlib.sha256("%s:%s" % (seed, stream)).hexdigest()
+    return random.Random(long(digest, 16))
+
+def newSeed():
+    """
+    Fresh seed from the OS entropy pool - independent of the global random module, so forked workers can't collide
+    :return: int seed
+    """
+    return int(random.SystemRandom().getrandbits(62))
+
+def normaliseSeed(seed):
+    """
+    Maps a seed onto the unsigned 64 bit range stored game states hold (see gameStateCodec)
+    Seeds already in range are unchanged, other ints wrap around and strings are hashed
+    :param seed: int or string seed
+    :return: int seed in [0, 2^64)
+    """
+    if isinstance(seed, basestring):
+        return int(hashlib.sha256(seed).hexdigest()[:16], 16)
+    if isinstance(seed, (int, long)) and not isinstance(seed, bool):
+        return int(seed % (1 << 64))
+    raise ValueError("Seed must be an int or string, not %r" % (seed,))
 
 
 class Deck (object):
-    def __init__(self, shuffled=True, currentPosition=0, deck=None):
+    def __init__(self, shuffled=True, currentPosition=0, deck=None, seed=None, stream=0):
         """
         Initialise deck object with 52 cards
         :param shuffled: If true, shuffles initialised deck
         :param currentPosition: Current position in deck to deal from
+        :param deck: List of 52 card strings or ids to use instead of a new deck (e.g. from a stored game state)
+        :param seed: Seed to shuffle with - the same seed and stream always give the same deck (None for global random)
+        :param stream: Stream number within the seed, e.g. the round number
         :return: None
         """
         assert isinstance(shuffled, bool)
         assert isinstance(currentPosition, int)
 
-        ranks = ['2', '3' ,'4', '5', '6', '7', '8', '9', 'T', 'J', 'Q', 'K', 'A']
-        suits = ['H', 'D', 'S', 'C']
-        self.deck = []
         self.currentPosition = currentPosition
+        self.shuffled = shuffled
+        self.seed = seed
+        self.stream = stream
+        self._deck = None
 
-        if (deck == None):
-            for suit in suits:
-                for rank in ranks:
-                    c = Card(card=rank+suit)
-                    self.deck.append(c)
-
-            if (shuffled):
-                self.deck = self.shuffle(self.deck)
-
-        else:
+        if (deck != None):
             assert isinstance(deck, list)
             assert len(deck) == 52
-            for card in deck:
-                if type(card) == Card:
-                    self.deck.append(card)
-                else:
-                    assert isinstance(card, basestring)
-                    assert len(card) == 2
-                    self.deck.append(Card(card))
-
-    def shuffle(self, cards):
+            # Card strings (e.g. from a stored game state) and card ids both map to the interned Card objects
+            self._deck = [Card(card) for card in deck]
+
+    @property
+    def deck(self):
+        """
+        List of the 52 Card objects in deal order - a new deck is only built and shuffled the first time it's needed,
+        so game states which never deal (e.g. placement updates) skip it
+        :return: List of Card objects
+        """
+        if (self._deck == None):
+            self._deck = [Card(rank + suit) for suit in SUITS for rank in RANKS]
+
+            if (self.shuffled):
+                rng = seededRandom(self.seed, self.stream) if self.seed != None else None
+                self._deck = self.shuffle(self._deck, rng)
+        return self._deck
+
+    def shuffle(self, cards, rng=None):
         """
         :param cards: Deck object
+        :param rng: random.Random object to shuffle with (None for the global random module)
         :return: Shuffled deck
         """
         assert isinstance(cards, list)
 
-        random.shuffle(cards)
+        if (rng != None):
+            rng.shuffle(cards)
+        else:
+            random.shuffle(cards)
         return cards
 
     def deal_one(self):
@@ -72,7 +114,8 @@ class Deck (object):
         return [self.deal_one() for i in range(0, n)]
 
 if __name__ == "__main__":
-    # Testing functionality
-    d = Deck(deck="7C9C6C3S5S5D3C8HQHQCAHTSKD5C4H7DACJS7S9SADKS6STH4DQS6D7H8D5H4C8S4SJC3HAS3D8C6H2SKCQDTD9H9DJDKHTC2D2C2HJH")
-    for i in range(0,52):
-        print(d.deal_one().card)
+    # Testing functionality - a seed and stream always regenerate the same deck
+    d = Deck(seed=1234, stream=1)
+    print "".join([c.card for c in d.deal_n(52)])
+    print "".join([c.card for c in Deck(seed=1234, stream=1).deck]) == "".join([c.card for c in d.deck])
+    print "".join([c.card for c in Deck(seed=1234, stream=2).deal_n(52)])
@@ -1,16 +1,25 @@
 __author__ = 'Alastair Kerr'
 
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # Only needed for the batch evaluator
+
 
 def classify_5(score_or_hand):
     """
-    Takes score tuple from simple_3card_evaluator output and classifies hand, or if given hand will score automatically
+    Takes score tuple or int strength from score_5/strength_5 output and classifies hand, or if given hand will score automatically
     e.g. 'Three of a Kind Ks', 'Pair of As, 7 kicker'
-    :param score_or_hand: Score tuple (output from simple_3card_evaluator) or hand string
+    :param score_or_hand: Score tuple, int strength or hand string
     :return: Human readable hand classification
     """
 
     if (type(score_or_hand) == tuple):
         score = score_or_hand
+    elif isinstance(score_or_hand, (int, long)):
+        score = strength_to_score(score_or_hand)
     else:
         score = score_5(score_or_hand)
 
@@ -44,8 +53,124 @@ def classify_5(score_or_hand):
 
 def score_5(hand):
     """
-    Takes in 5 card poker hand and evaluates for high card, pair or three of a kind
-    :param hand: 5 card poker hand as 5 char string: <rank><suit> 5 times
+    Takes in 5 card poker hand and scores it with a single lookup table access
+    Tables are keyed on the product of each card's rank prime, which is unique for every multiset of ranks
+    :param hand: 5 card poker hand as 10 char string: <rank><suit> 5 times
+    :return: Poker hand score tuple (identical to score_5_histogram)
+    """
+    assert len(hand) == 10
+
+    primes = RANK_CHAR_TO_PRIME
+    try:
+        key = primes[hand[0]] * primes[hand[2]] * primes[hand[4]] * primes[hand[6]] * primes[hand[8]]
+    except KeyError:
+        print("Invalid value! ", hand, "could not be converted to int.\n")
+        return None
+
+    if hand[1] == hand[3] == hand[5] == hand[7] == hand[9]:
+        return FLUSH_SCORES[key]
+    return UNSUITED_SCORES[key]
+
+def strength_5(hand):
+    """
+    Takes in 5 card poker hand and returns its integer strength (see score_to_strength)
+    Comparing strengths gives the same result as comparing score tuples
+    :param hand: 5 card poker hand as 10 char string: <rank><suit> 5 times
+    :return: int strength
+    """
+    primes = RANK_CHAR_TO_PRIME
+    key = primes[hand[0]] * primes[hand[2]] * primes[hand[4]] * primes[hand[6]] * primes[hand[8]]
+    if hand[1] == hand[3] == hand[5] == hand[7] == hand[9]:
+        return FLUSH_STRENGTHS[key]
+    return UNSUITED_STRENGTHS[key]
+
+def score_5_cards(cards):
+    """
+    Scores a 5 card poker hand given as card ids, skipping any string parsing
+    :param cards: Sequence of 5 Card objects or card ids (0-51, see card.py)
+    :return: Poker hand score tuple
+    """
+    a, b, c, d, e = cards
+    primes = CARD_PRIMES
+    key = primes[a] * primes[b] * primes[c] * primes[d] * primes[e]
+    # Suit is the low 2 bits of a card id
+    if ((a ^ b) | (a ^ c) | (a ^ d) | (a ^ e)) & 3 == 0:
+        return FLUSH_SCORES[key]
+    return UNSUITED_SCORES[key]
+
+def strength_5_cards(cards):
+    """
+    Returns the int strength of a 5 card poker hand given as card ids
+    :param cards: Sequence of 5 Card objects or card ids (0-51, see card.py)
+    :return: int strength
+    """
+    a, b, c, d, e = cards
+    primes = CARD_PRIMES
+    key = primes[a] * primes[b] * primes[c] * primes[d] * primes[e]
+    if ((a ^ b) | (a ^ c) | (a ^ d) | (a ^ e)) & 3 == 0:
+        return FLUSH_STRENGTHS[key]
+    return UNSUITED_STRENGTHS[key]
+
+def score_5_batch(cards):
+    """
+    Vectorised scoring of many 5 card hands at once (requires numpy)
+    Each hand's sorted ranks index a dense strength table, so the whole batch is a handful of array operations
+    :param cards: (N, 5) integer array-like of card ids (0-51, see card.py)
+    :return: (strengths, categories) int arrays of length N, matching strength_5_cards and score_5_cards()[0]
+    """
+    if numpy is None:
+        raise ImportError("score_5_batch requires numpy")
+    if BATCH_UNSUITED_STRENGTHS is None:
+        build_batch_tables()
+
+    cards = numpy.asarray(cards, dtype=numpy.intp)
+    assert cards.ndim == 2 and cards.shape[1] == 5
+
+    ranks = numpy.sort(cards >> 2, axis=1)
+    index = ranks[:, 0]
+    for i in xrange(1, 5):
+        index = index * 13 + ranks[:, i]
+    suits = cards & 3
+    flush = (suits == suits[:, :1]).all(axis=1)
+
+    strengths = numpy.where(flush, BATCH_FLUSH_STRENGTHS[index], BATCH_UNSUITED_STRENGTHS[index])
+    return strengths, strengths >> 12
+
+def score_to_strength(score):
+    """
+    Packs a score tuple into a single int, one 4 bit nibble per tuple entry (most significant first)
+    Missing entries pack as 0, so int comparison matches tuple comparison e.g. (2, 8, 5) < (2, 8, 13, 4)
+    3 and 5 card scores share this scale, so a top row strength can be compared directly with a middle row's
+    :param score: Score tuple e.g. (7, 14, 13)
+    :return: int strength
+    """
+    strength = 0
+    for i in xrange(0, 4):
+        strength <<= 4
+        if i < len(score):
+            strength |= score[i]
+    return strength
+
+def strength_to_score(strength):
+    """
+    Unpacks an int strength back into its score tuple, inverse of score_to_strength
+    :param strength: int strength
+    :return: Score tuple
+    """
+    if strength == 0:
+        return (0, 0)
+    score = []
+    for shift in (12, 8, 4, 0):
+        value = (strength >> shift) & 0xF
+        if value == 0:
+            break
+        score.append(value)
+    return tuple(score)
+
+def score_5_histogram(hand):
+    """
+    Original histogram based evaluator - slow, but used as the reference to build the lookup tables
+    :param hand: 5 card poker hand as 10 char string: <rank><suit> 5 times
     :return: Poker hand score
     """
     assert isinstance(hand, basestring)
@@ -232,6 +357,74 @@ def rankCharToVal(rank):
     return int(rank)
 
 
+RANK_CHARS = '23456789TJQKA'
+RANK_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+RANK_CHAR_TO_PRIME = dict(zip(RANK_CHARS, RANK_PRIMES))
+# Rank prime for each card id (card id = rank index * 4 + suit index)
+CARD_PRIMES = tuple([RANK_PRIMES[cardId >> 2] for cardId in xrange(0, 52)])
+
+# Lookup tables keyed on rank prime product, built once on import by build_lookup_tables
+UNSUITED_SCORES = {}
+FLUSH_SCORES = {}
+UNSUITED_STRENGTHS = {}
+FLUSH_STRENGTHS = {}
+# Dense numpy tables for score_5_batch, built on first use by build_batch_tables
+BATCH_UNSUITED_STRENGTHS = None
+BATCH_FLUSH_STRENGTHS = None
+
+
+def build_lookup_tables():
+    """
+    Scores every multiset of 5 ranks (and every flush) once with the histogram evaluator and stores the results
+    Only 6175 rank multisets + 1287 flushes exist, covering all 2,598,960 five card hands
+    :return: None
+    """
+    suits = 'HDSC'
+    for ranks in itertools.combinations_with_replacement(xrange(0, 13), 5):
+        if ranks[0] == ranks[4]:
+            continue # Five of a kind is impossible
+        key = 1
+        for r in ranks:
+            key *= RANK_PRIMES[r]
+
+        # Sorted ranks keep duplicates adjacent, so cycling the suits never repeats a card or makes a flush
+        hand = ''.join([RANK_CHARS[r] + suits[i % 4] for i, r in enumerate(ranks)])
+        score = score_5_histogram(hand)
+        UNSUITED_SCORES[key] = score
+        FLUSH_SCORES[key] = score
+
+        if len(set(ranks)) == 5:
+            hand = ''.join([RANK_CHARS[r] + suits[0] for r in ranks])
+            FLUSH_SCORES[key] = score_5_histogram(hand)
+
+    for key in UNSUITED_SCORES:
+        UNSUITED_STRENGTHS[key] = score_to_strength(UNSUITED_SCORES[key])
+        FLUSH_STRENGTHS[key] = score_to_strength(FLUSH_SCORES[key])
+
+def build_batch_tables():
+    """
+    Builds the dense numpy strength tables used by score_5_batch, indexed by the 5 sorted rank indices in base 13
+    :return: None
+    """
+    global BATCH_UNSUITED_STRENGTHS, BATCH_FLUSH_STRENGTHS
+    unsuited = numpy.zeros(13 ** 5, dtype=numpy.int32)
+    flush = numpy.zeros(13 ** 5, dtype=numpy.int32)
+    for ranks in itertools.combinations_with_replacement(xrange(0, 13), 5):
+        if ranks[0] == ranks[4]:
+            continue
+        index = 0
+        key = 1
+        for r in ranks:
+            index = index * 13 + r
+            key *= RANK_PRIMES[r]
+        unsuited[index] = UNSUITED_STRENGTHS[key]
+        flush[index] = FLUSH_STRENGTHS[key]
+    BATCH_UNSUITED_STRENGTHS, BATCH_FLUSH_STRENGTHS = unsuited, flush
+
+
+build_lookup_tables()
+
+
 if __name__ == "__main__":
     # Testng functionality
     hand = "3C4C5C6C7C"
@@ -1,19 +1,43 @@
 __author__ = 'Alastair Kerr'
 
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # Only needed for the batch evaluator
+
+from eval import score_to_strength, strength_to_score
+
 
 def classify_3(score_or_hand):
     """
-    Takes score tuple from simple_3card_evaluator output and classifies hand, or if given hand will score automatically
+    Takes score tuple or int strength from score_3/strength_3 output and classifies hand, or if given hand will score automatically
     e.g. 'Three of a Kind Ks', 'Pair of As, 7 kicker'
-    :param score_or_hand: Score tuple (output from simple_3card_evaluator) or hand string
+    All forms are served from lookup tables built on import
+    :param score_or_hand: Score tuple, int strength or hand string
     :return: Human readable hand classification
     """
-
     if (type(score_or_hand) == tuple):
-        score = score_or_hand
-    else:
-        score = score_3(score_or_hand)
+        try:
+            return SCORE_CLASSIFICATIONS[score_or_hand]
+        except KeyError:
+            return describe_score_3(score_or_hand)
+    elif isinstance(score_or_hand, (int, long)):
+        try:
+            return STRENGTH_CLASSIFICATIONS[score_or_hand]
+        except KeyError:
+            return describe_score_3(strength_to_score(score_or_hand))
 
+    primes = RANK_CHAR_TO_PRIME
+    return CLASSIFICATIONS[primes[score_or_hand[0]] * primes[score_or_hand[2]] * primes[score_or_hand[4]]]
+
+def describe_score_3(score):
+    """
+    Builds the human readable classification text for a score tuple
+    :param score: Score tuple (output from score_3)
+    :return: Human readable hand classification
+    """
     score_to_classification = {4:'Three of a Kind ', 2:'Pair of ', 1:'High Card: '}
 
     hand_name = score_to_classification[score[0]]
@@ -31,7 +55,80 @@ def classify_3(score_or_hand):
 
 def score_3(hand):
     """
-    Takes in 3 card poker hand and evaluates for high card, pair or three of a kind
+    Takes in 3 card poker hand and scores it with a single lookup table access
+    Suits never matter for 3 card hands, so the table is keyed on the product of each card's rank prime
+    :param hand: 3 card poker hand as 6 char string: <rank><suit> 3 times
+    :return: Poker hand score tuple (identical to score_3_histogram)
+    """
+    assert len(hand) == 6
+
+    primes = RANK_CHAR_TO_PRIME
+    try:
+        return SCORES[primes[hand[0]] * primes[hand[2]] * primes[hand[4]]]
+    except KeyError:
+        print("Invalid value! ", hand, "could not be converted to int.\n")
+        return None
+
+def score_3_cards(cards):
+    """
+    Scores a 3 card poker hand given as card ids, skipping any string parsing
+    :param cards: Sequence of 3 Card objects or card ids (0-51, see card.py)
+    :return: Poker hand score tuple
+    """
+    a, b, c = cards
+    primes = CARD_PRIMES
+    return SCORES[primes[a] * primes[b] * primes[c]]
+
+def strength_3(hand):
+    """
+    Takes in 3 card poker hand and returns its int strength (see eval.score_to_strength)
+    :param hand: 3 card poker hand as 6 char string: <rank><suit> 3 times
+    :return: int strength
+    """
+    primes = RANK_CHAR_TO_PRIME
+    return STRENGTHS[primes[hand[0]] * primes[hand[2]] * primes[hand[4]]]
+
+def strength_3_cards(cards):
+    """
+    Returns the int strength of a 3 card poker hand given as card ids
+    :param cards: Sequence of 3 Card objects or card ids (0-51, see card.py)
+    :return: int strength
+    """
+    a, b, c = cards
+    primes = CARD_PRIMES
+    return STRENGTHS[primes[a] * primes[b] * primes[c]]
+
+def score_3_batch(cards):
+    """
+    Vectorised scoring of many 3 card hands at once (requires numpy)
+    :param cards: (N, 3) integer array-like of card ids (0-51, see card.py)
+    :return: (strengths, categories) int arrays of length N, matching strength_3_cards and score_3_cards()[0]
+    """
+    if numpy is None:
+        raise ImportError("score_3_batch requires numpy")
+    if BATCH_STRENGTHS is None:
+        build_batch_tables()
+
+    cards = numpy.asarray(cards, dtype=numpy.intp)
+    assert cards.ndim == 2 and cards.shape[1] == 3
+
+    ranks = numpy.sort(cards >> 2, axis=1)
+    strengths = BATCH_STRENGTHS[(ranks[:, 0] * 13 + ranks[:, 1]) * 13 + ranks[:, 2]]
+    return strengths, strengths >> 12
+
+def score_3_many(hands):
+    """
+    Scores a list of 3 card poker hands in one call
+    :param hands: List of 6 char hand strings
+    :return: List of score tuples, in the same order as hands
+    """
+    primes = RANK_CHAR_TO_PRIME
+    scores = SCORES
+    return [scores[primes[hand[0]] * primes[hand[2]] * primes[hand[4]]] for hand in hands]
+
+def score_3_histogram(hand):
+    """
+    Original histogram based evaluator - slow, but used as the reference to build the lookup tables
     :param hand: 3 card poker hand as 6 char string: <rank><suit> 3 times
     :return: Poker hand score
     """
@@ -149,6 +246,54 @@ def rankValToChar(rank):
     return str(rank)
 
 
+RANK_CHARS = '23456789TJQKA'
+RANK_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+RANK_CHAR_TO_PRIME = dict(zip(RANK_CHARS, RANK_PRIMES))
+# Rank prime for each card id (card id = rank index * 4 + suit index)
+CARD_PRIMES = tuple([RANK_PRIMES[cardId >> 2] for cardId in xrange(0, 52)])
+
+# Lookup tables keyed on rank prime product, built once on import by build_lookup_tables
+SCORES = {}
+CLASSIFICATIONS = {}
+SCORE_CLASSIFICATIONS = {}
+STRENGTHS = {}
+STRENGTH_CLASSIFICATIONS = {}
+# Dense numpy table for score_3_batch, built on first use by build_batch_tables
+BATCH_STRENGTHS = None
+
+
+def build_lookup_tables():
+    """
+    Scores and classifies each of the 455 multisets of 3 ranks once, covering all 22,100 three card hands
+    :return: None
+    """
+    suits = 'HDS'
+    for ranks in itertools.combinations_with_replacement(xrange(0, 13), 3):
+        key = RANK_PRIMES[ranks[0]] * RANK_PRIMES[ranks[1]] * RANK_PRIMES[ranks[2]]
+        hand = ''.join([RANK_CHARS[r] + suits[i] for i, r in enumerate(ranks)])
+        score = score_3_histogram(hand)
+        SCORES[key] = score
+        STRENGTHS[key] = score_to_strength(score)
+        CLASSIFICATIONS[key] = describe_score_3(score)
+        SCORE_CLASSIFICATIONS[score] = CLASSIFICATIONS[key]
+        STRENGTH_CLASSIFICATIONS[STRENGTHS[key]] = CLASSIFICATIONS[key]
+
+def build_batch_tables():
+    """
+    Builds the dense numpy strength table used by score_3_batch, indexed by the 3 sorted rank indices in base 13
+    :return: None
+    """
+    global BATCH_STRENGTHS
+    strengths = numpy.zeros(13 ** 3, dtype=numpy.int32)
+    for ranks in itertools.combinations_with_replacement(xrange(0, 13), 3):
+        index = (ranks[0] * 13 + ranks[1]) * 13 + ranks[2]
+        strengths[index] = STRENGTHS[RANK_PRIMES[ranks[0]] * RANK_PRIMES[ranks[1]] * RANK_PRIMES[ranks[2]]]
+    BATCH_STRENGTHS = strengths
+
+
+build_lookup_tables()
+
+
 if __name__ == "__main__":
     # Testing functionality
     hand = "ASADJC"
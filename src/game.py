@@ -3,6 +3,7 @@ __author__ = 'Alastair Kerr'
 from player import Player
 from board import Board
 from scorer import Scorer
+from deck import newSeed, normaliseSeed
 import tools
 
 import uuid
@@ -10,13 +11,19 @@ import uuid
 
 class Game(object):
     def __init__(self, playerCount=2, firstToAct=1, nextToAct=1, actingOrderPointer=0, \
-                 roundNumber=1, roundActionNumber=1, deck=None, deckPointer=0, variant='ofc'):
+                 roundNumber=1, roundActionNumber=1, deck=None, deckPointer=0, variant='ofc', seed=None, \
+                 playerIds=None, placementsLoader=None):
         """
         Initialise Game object
         Each game has a current round number, Player objects and a board object for each round
         :param playerCount: int number of players
         :param firstToAct: int playerNumber who acts first this round
-        :param deck: 104 char string containing card names format <rank><suit>*52
+        :param deck: List of 52 card strings (legacy game states which stored the deck)
+        :param seed: Seed for dealing - each round's deck is regenerated from the seed and round number.
+                     A new seed is drawn if neither seed nor deck is given. Negative, oversized and string seeds
+                     are normalised to unsigned 64 bits (see deck.normaliseSeed) so the game state can be stored
+        :param playerIds: List of player id strings for an existing game (new ids are generated if None)
+        :param placementsLoader: Function to hydrate this round's placements when first read (see Board)
         :return: None
         """
         assert isinstance(playerCount, int)
@@ -32,12 +39,31 @@ class Game(object):
         self.roundActionNumber = roundActionNumber
         self.roundNumber = roundNumber
         self.variant = variant
+        self.seed = normaliseSeed(seed) if seed != None else None
+        if (seed == None and deck == None):
+            self.seed = newSeed()
 
-        self.board = Board(playerCount=playerCount, deck=deck, deckPointer=deckPointer)
+        self.board = Board(playerCount=playerCount, deck=deck, deckPointer=deckPointer, seed=self.seed, \
+                           stream=roundNumber, placementsLoader=placementsLoader)
         self.players = self.createPlayers()
-        self.playerIds = self.createPlayerIds()
+        self.playerIds = playerIds if playerIds != None else self.createPlayerIds()
+        assert len(self.playerIds) == playerCount
 
-        self.scoring = Scorer(players=self.players, board=self.board)
+        # Compiled game state dict, patched in place by gameHandlerHelpers.compileGameState as the game changes
+        self.compiledState = None
+        self.dirtyPlayers = set()  # Player numbers whose cards or score changed since the state was last compiled
+
+        self._scoring = None
+
+    @property
+    def scoring(self):
+        """
+        Scorer for the current board - only created when a round is scored
+        :return: Scorer object
+        """
+        if (self._scoring == None or self._scoring.board is not self.board):
+            self._scoring = Scorer(players=self.players, board=self.board)
+        return self._scoring
 
     def createPlayers(self):
         """
@@ -66,10 +92,15 @@ class Game(object):
 
     def resetBoard(self):
         """
-        Clears board and generates new deck of cards
+        Clears board and generates new deck of cards for the current round number
         :return: None
         """
-        self.board = Board(playerCount=self.playerCount)
+        if (self.seed == None):
+            # Legacy game dealt from a stored deck - carry on with a seeded game from here
+            self.seed = newSeed()
+        self.board = Board(playerCount=self.playerCount, seed=self.seed, stream=self.roundNumber)
+        # New board and deck - compile the next game state from scratch
+        self.compiledState = None
 
     def newRound(self):
         """
@@ -77,8 +108,8 @@ class Game(object):
         :return: None
         """
         self.scoreBoard()
-        self.resetBoard()
         self.roundNumber += 1
+        self.resetBoard()
         self.incrementNextToAct()
         self.actingOrder = self.generateActingOrder(self.nextToAct)
 
@@ -88,6 +119,7 @@ class Game(object):
         :return: None
         """
         self.scoring.scoreAll()
+        self.markPlayersDirty()
 
     def interpretScores(self):
         """
@@ -106,6 +138,29 @@ class Game(object):
 
         return returnStr
 
+    def markPlayersDirty(self, playerNumbers=None):
+        """
+        Flag players whose cards or score changed, so compileGameState re-serialises them
+        :param playerNumbers: List of int player numbers (None for every player)
+        :return: None
+        """
+        if playerNumbers == None:
+            playerNumbers = range(1, self.playerCount + 1)
+        self.dirtyPlayers.update(playerNumbers)
+
+    def clearDirty(self):
+        """
+        Marks every player and row as serialised - called once the compiled game state is up to date
+        :return: None
+        """
+        self.dirtyPlayers.clear()
+        if not self.board.placementsLoaded():
+            return
+        for placement in self.board.placements:
+            placement.bottomRow.dirty = False
+            placement.middleRow.dirty = False
+            placement.topRow.dirty = False
+
     def generateActingOrder(self, firstToAct=1):
         """
         Generates actingOrder for clockwise rotation of player action
@@ -181,6 +236,7 @@ class Game(object):
             raise ValueError("Player already has cards dealt!")
         cards = self.board.deck.deal_n(5)
         self.players[playerNumber - 1].cards = cards
+        self.dirtyPlayers.add(playerNumber)
         self.incrementNextToAct()
 
         return cards
@@ -197,6 +253,7 @@ class Game(object):
 
         card = self.board.deck.deal_one()
         self.players[playerNumber - 1].cards.append(card)
+        self.dirtyPlayers.add(playerNumber)
         self.incrementNextToAct()
 
         return [card]
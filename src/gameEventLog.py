@@ -0,0 +1,243 @@
+__author__ = "Alastair Kerr"
+
+import collections
+import threading
+
+import tools
+import gameHandlerHelpers
+import gameStateCodec
+
+
+class GameEventLog(object):
+    """
+    Append-only store of game events in front of a Database, with the same get_game_state/update_game_state
+    interface so the Api (or a GameStateCache) can use either
+    Each update is written as a small delta from the previous state (see gameHandlerHelpers.diffGameStates) rather
+    than overwriting the whole game state, with a full snapshot every snapshot_interval events. Games are rebuilt
+    from their latest snapshot plus the events after it, and the events double as a full hand history
+    Assumes this process is the only writer for the games it serves. Updates to the same game are serialised so
+    concurrent requests can't claim the same sequence number
+    """
+    def __init__(self, database, snapshot_interval=20, max_games=10000, lock_stripes=64):
+        """
+        :param database: Database object (used for execute_query and game_state_value)
+        :param snapshot_interval: Events written between full snapshots
+        :param max_games: Most games whose latest state and sequence number are held in memory
+        :param lock_stripes: Number of per-game update locks (games share a lock when their ids hash to the same one)
+        """
+        assert snapshot_interval > 0
+        self.database = database
+        self.snapshot_interval = snapshot_interval
+        self.max_games = max_games
+
+        self.lock = threading.Lock()
+        # game_id -> [last sequence number, events since the last snapshot, latest game state dict]
+        self.heads = collections.OrderedDict()
+        self.game_locks = [threading.Lock() for i in range(lock_stripes)]
+
+    def query_events(self, game_id):
+        """
+        Reads the latest snapshot for a game and every event after it
+        :param game_id: str uuid4
+        :return: List of (sequence, event_type, payload) tuples in sequence order
+        """
+        query = "SELECT sequence, event_type, payload FROM game_events WHERE game_id = %s AND sequence >= " \
+                "(SELECT MAX(sequence) FROM game_events WHERE game_id = %s AND event_type = 'snapshot') ORDER BY sequence"
+        result = self.database.execute_query(query, (game_id, game_id))
+        if isinstance(result, basestring):
+            raise IOError(result)
+        return list(result)
+
+    def append_events(self, game_id, events):
+        """
+        Appends events for a game in one INSERT
+        :param game_id: str uuid4
+        :param events: List of (sequence, event_type, str payload) tuples
+        :return: Result of query (error string on failure)
+        """
+        params = []
+        for sequence, event_type, payload in events:
+            params.extend([game_id, sequence, event_type, payload])
+        query = "INSERT INTO game_events (game_id, sequence, event_type, payload) VALUES %s" % \
+                ", ".join(["(%s, %s, %s, %s)"] * len(events))
+        return self.database.execute_query(query, tuple(params))
+
+    def load_game(self, game_id):
+        """
+        Rebuilds a game from its latest snapshot plus the events after it
+        :param game_id: str uuid4
+        :return: (last sequence number, events since the snapshot, game state dict)
+        """
+        rows = self.query_events(game_id)
+        if not rows or rows[0][1] != 'snapshot':
+            raise KeyError("No snapshot for game id '%s'" % game_id)
+
+        snapshot = gameStateCodec.loadGameState(rows[0][2])
+        deltas = [tools.load_dictionary_from_string(row[2]) for row in rows[1:]]
+        return rows[-1][0], len(deltas), gameHandlerHelpers.replayGameStateDeltas(snapshot, deltas)
+
+    def get_head(self, game_id):
+        """
+        :return: [last sequence number, events since the snapshot, game state dict] for a game, or None if it has
+                 no events yet
+        """
+        with self.lock:
+            head = self.heads.get(game_id)
+            if head != None:
+                del self.heads[game_id]
+                self.heads[game_id] = head
+                return head
+
+        try:
+            head = list(self.load_game(game_id))
+        except KeyError:
+            return None
+        self.set_head(game_id, head)
+        return head
+
+    def set_head(self, game_id, head):
+        """
+        Remembers the latest state of a game, dropping the least recently used games beyond max_games
+        :return: None
+        """
+        with self.lock:
+            self.heads.pop(game_id, None)
+            self.heads[game_id] = head
+            while len(self.heads) > self.max_games:
+                self.heads.popitem(last=False)
+
+    def game_lock(self, game_id):
+        """
+        :return: Lock held while updating the given game
+        """
+        return self.game_locks[hash(game_id) % len(self.game_locks)]
+
+    def get_game_state(self, game_id, sanitised=False):
+        """
+        Returns the current game state for the given game_id
+        :param game_id: str uuid4
+        :param sanitised: True to strip the deck and seed for the frontend (a copy is returned)
+        :return: Game state
+        """
+        game_id = str(game_id)
+        head = self.get_head(game_id)
+        if head == None:
+            raise KeyError("No events for game id '%s'" % game_id)
+
+        game_state = head[2]
+        if sanitised:
+            game_state = gameHandlerHelpers.copyGameState(game_state)
+            for key in ['deck', 'seed']:
+                game_state['gameState'].pop(key, None)
+        return game_state
+
+    def event_type(self, delta):
+        """
+        Names an event from what it changed: a deal moves the deck pointer, a placement changes rows
+        :param delta: diffGameStates delta
+        :return: 'deal', 'placement' or 'update' (anything else, e.g. a new round or several coalesced actions)
+        """
+        dealt = 'deckPointer' in delta['gameState']
+        placed = len(delta['placements']) > 0
+        if dealt and not placed and delta['gameState'].get('roundNumber') == None:
+            return 'deal'
+        if placed and not dealt:
+            return 'placement'
+        return 'update'
+
+    def update_game_state(self, game_id, game_state):
+        """
+        Appends the change from the game's previous state as an event, with a snapshot every snapshot_interval events
+        New games start with a snapshot. The log keeps a reference to game_state, so don't modify it afterwards
+        :param game_id: uuid for this game
+        :param game_state: dictionary with game state information
+        :return: Result of query (error string on failure)
+        """
+        game_id = str(game_id)
+        # Read, diff and append as one step per game, or two writers would both append the next sequence number
+        with self.game_lock(game_id):
+            return self.append_update(game_id, game_state)
+
+    def append_update(self, game_id, game_state):
+        """
+        Writes an update for a game - call with the game's lock held (see update_game_state)
+        :return: Result of query (error string on failure)
+        """
+        head = self.get_head(game_id)
+
+        events = []
+        if head == None:
+            sequence, since_snapshot = 0, 0
+        else:
+            sequence, since_snapshot = head[0] + 1, head[1] + 1
+            delta = gameHandlerHelpers.diffGameStates(head[2], game_state)
+            if not (delta['gameState'] or delta['players'] or delta['placements']):
+                return ()
+            events.append((sequence, self.event_type(delta), str(delta)))
+
+        if head == None or since_snapshot >= self.snapshot_interval:
+            if events:
+                sequence += 1
+            events.append((sequence, 'snapshot', self.database.game_state_value(game_state)))
+            since_snapshot = 0
+
+        result = self.append_events(game_id, events)
+        if result and isinstance(result, basestring):
+            # Failed write - reload from the database next time rather than trust the sequence numbers held here
+            with self.lock:
+                self.heads.pop(game_id, None)
+            return result
+
+        self.set_head(game_id, [sequence, since_snapshot, game_state])
+        return result
+
+    def hand_history(self, game_id):
+        """
+        Every event recorded for a game, for replay and analysis
+        :param game_id: str uuid4
+        :return: List of (sequence, event_type, payload dict) - snapshots are game states, other events deltas
+        """
+        query = "SELECT sequence, event_type, payload FROM game_events WHERE game_id = %s ORDER BY sequence"
+        result = self.database.execute_query(query, (str(game_id),))
+        if isinstance(result, basestring):
+            raise IOError(result)
+        return [(sequence, event_type, gameStateCodec.loadGameState(payload)) for sequence, event_type, payload in result]
+
+
+if __name__ == "__main__":
+    # Testing functionality - log a game in memory and rebuild it through GameHandler
+    from gameHandler import GameHandler
+
+    class LiteralDatabase(object):
+        def game_state_value(self, game_state):
+            return str(game_state)
+
+    class MemoryEventLog(GameEventLog):
+        def __init__(self, **kwargs):
+            GameEventLog.__init__(self, LiteralDatabase(), **kwargs)
+            self.rows = []
+
+        def query_events(self, game_id):
+            snapshots = [row[0] for row in self.rows if row[1] == 'snapshot']
+            return [row for row in self.rows if snapshots and row[0] >= max(snapshots)]
+
+        def append_events(self, game_id, events):
+            for sequence, event_type, payload in events:
+                self.rows.append((sequence, event_type, payload))
+
+    log = MemoryEventLog(snapshot_interval=8)
+    g = GameHandler(variant='ofc', playerCount=2)
+    log.update_game_state('game', gameHandlerHelpers.copyGameState(g.getCompiledGameState()))
+    for i in range(0, 12):
+        g.getNextActionDetails()
+        log.update_game_state('game', gameHandlerHelpers.copyGameState(g.getCompiledGameState()))
+
+    log.heads.clear()
+    sequence, since_snapshot, state = log.load_game('game')
+    print "Rebuilt at sequence %i from a snapshot %i events back: %s" % (sequence, since_snapshot,
+                                                                        state == g.getCompiledGameState())
+    print [(row[0], row[1], len(row[2])) for row in log.rows]
+    rows = log.query_events('game')
+    h = GameHandler(variant='ofc', playerCount=2, gameState=tools.load_dictionary_from_string(rows[0][2]),
+                    events=[tools.load_dictionary_from_string(row[2]) for row in rows[1:]])
+    print h.getCompiledGameState() == g.getCompiledGameState()
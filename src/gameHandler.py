@@ -5,49 +5,106 @@ import json
 from ofc import OFC
 from pineapple import Pineapple
 import gameHandlerHelpers
+import gameStateCodec
+
+
+# Actions GameHandler can hydrate lazily for - any other action (or None) hydrates every player's cards
+ACTIONS = ['nextAction', 'updateGameState']
 
 
 class GameHandler(object):
-    def __init__(self, variant='ofc', playerCount=2, gameState={}):
+    def __init__(self, variant='ofc', playerCount=2, gameState={}, action=None, events=None):
         """
         Initialises game handler object
         Game handler communicates between server and back end logic
+        Placements and the deck are only built if the action reads them, and only the hands the action touches are
+        read in: a nextAction deals to one player, and an updateGameState replaces every hand from the new state
+        :param gameState: Game state dict, or a stored game state string in either format (see gameStateCodec)
+        :param action: Action this handler will serve ('nextAction', 'updateGameState' or None for everything)
+        :param events: List of game state deltas recorded after gameState, oldest first - the game is rebuilt from
+                       gameState as a snapshot plus these events (see gameEventLog)
         :return: None
         """
         assert isinstance(variant, basestring)
         assert variant.lower() in ['ofc', 'pineapple']
         assert isinstance(playerCount, int)
         assert 1 < playerCount <= 4
+        if isinstance(gameState, basestring):
+            gameState = gameStateCodec.loadGameState(gameState)
         assert isinstance(gameState, dict)
+        if events:
+            gameState = gameHandlerHelpers.replayGameStateDeltas(gameState, events)
+        assert action == None or action in ACTIONS
 
         self.playerCount = playerCount
         self.gameState = gameState
+        self.action = action
 
         # Set defaults - overridden if gameState is passed
-        firstToAct, nextToAct, actingOrderPointer, roundNumber, roundActionNumber, deck, deckPointer = 1, 1, 0, 1, 1, None, 0
+        firstToAct, nextToAct, actingOrderPointer, roundNumber, roundActionNumber, deck, deckPointer, seed = \
+            1, 1, 0, 1, 1, None, 0, None
+        playerIds, placementsLoader = None, None
 
         if (gameState != {}):
             # Game state info overrides existing variables e.g. playerCount
             self.interpretPlayerCount(gameState)
-            firstToAct, nextToAct, actingOrderPointer, roundNumber, roundActionNumber, deck, deckPointer = \
+            firstToAct, nextToAct, actingOrderPointer, roundNumber, roundActionNumber, deck, deckPointer, seed = \
                 self.interpretGameVars(gameState['gameState'])
+            playerIds = self.interpretPlayerIds(gameState)
+            placementsLoader = self.loadPlacements
 
         self.game = None
         # Create a game object for the desired variant using any read in variables
         if (variant.lower() == 'ofc'):
             self.game = OFC(playerCount=self.playerCount, firstToAct=firstToAct, nextToAct=nextToAct, \
                             actingOrderPointer=actingOrderPointer, roundNumber=roundNumber, variant='ofc', \
-                            roundActionNumber=roundActionNumber, deck=deck, deckPointer=deckPointer)
+                            roundActionNumber=roundActionNumber, deck=deck, deckPointer=deckPointer, seed=seed, \
+                            playerIds=playerIds, placementsLoader=placementsLoader)
 
         elif (variant.lower() == 'pineapple'):
             self.game = Pineapple(playerCount=self.playerCount, firstToAct=firstToAct, nextToAct=nextToAct, \
                             actingOrderPointer=actingOrderPointer, roundNumber=roundNumber, variant='pineapple', \
-                            roundActionNumber=roundActionNumber, deck=deck, deckPointer=deckPointer)
+                            roundActionNumber=roundActionNumber, deck=deck, deckPointer=deckPointer, seed=seed, \
+                            playerIds=playerIds, placementsLoader=placementsLoader)
 
         if (gameState != {}):
-            # Update game state objects with read in information
-            self.interpretGameStatePlacements(gameState)
-            self.interpretPlayerCards(gameState)
+            # Update game state objects with read in information (placements are read in by loadPlacements if needed)
+            if (action == 'nextAction'):
+                self.interpretPlayerCards(gameState, [nextToAct])
+            elif (action == None):
+                self.interpretPlayerCards(gameState)
+            self.interpretPlayerScores(gameState)
+            if not gameHandlerHelpers.seedCompiledState(self.game, gameState) and action == 'nextAction':
+                # Compiled in full, so every player's cards are needed, not just those of the player to act
+                self.interpretPlayerCards(gameState)
+
+    def loadPlacements(self, placements):
+        """
+        Board placements loader - reads the game state placements in the first time anything uses them
+        The rows read in match the compiled state the game was seeded with, so they start clean
+        :param placements: List of new Placement objects (already set on the board)
+        :return: None
+        """
+        self.interpretGameStatePlacements(self.gameState)
+        if (self.game.compiledState != None):
+            for placement in placements:
+                placement.bottomRow.dirty = False
+                placement.middleRow.dirty = False
+                placement.topRow.dirty = False
+
+    def interpretPlayerIds(self, gameState={}):
+        """
+        Reads the player ids from game state so they stay the same across requests
+        :param gameState: Game State dict
+        :return: List of player id strings, or None for legacy game states without them
+        """
+        playerIds = []
+        for i in range(1, self.playerCount+1):
+            playerId = gameState['players'][str(i)].get('playerId')
+            if (playerId == None):
+                return None
+            playerIds.append(playerId)
+        return playerIds
 
     def interpretPlayerCount(self, gameState={}):
         """
@@ -61,31 +118,46 @@ class GameHandler(object):
         assert isinstance(self.playerCount, int)
         assert 1 < self.playerCount <= 4
 
-    def interpretPlayerCards(self, gameState={}):
+    def interpretPlayerCards(self, gameState={}, playerNumbers=None):
         """
         Interprets player cards from game state and updates game objects
         :param gameState: Game State dict
+        :param playerNumbers: List of int player numbers to read in (None for every player)
         :return: None
         """
         assert isinstance(gameState, dict)
-        for i in range(1, self.playerCount+1):
+        if (playerNumbers == None):
+            playerNumbers = range(1, self.playerCount+1)
+        for i in playerNumbers:
             self.game.players[i-1].cards = gameHandlerHelpers.convertCardsListToObj(gameState['players'][str(i)]['cards'])
 
+    def interpretPlayerScores(self, gameState={}):
+        """
+        Interprets player scores from game state and updates game objects
+        :param gameState: Game State dict
+        :return: None
+        """
+        assert isinstance(gameState, dict)
+        for i in range(1, self.playerCount+1):
+            self.game.players[i-1].score = int(gameState['players'][str(i)]['score'])
+
     def interpretGameVars(self, gameState={}):
         """
         Interprets game and round variables and returns these to initialise game objects with
         :param gameState: 'gameState' key:dict
-        :return: firstToAct, nextToAct, actingOrderPointer, roundNumber, roundActionNumber, deck, deckPointer
+        Seeded game states store only the seed (the deck is regenerated from it), older ones the full deck
+        :return: firstToAct, nextToAct, actingOrderPointer, roundNumber, roundActionNumber, deck, deckPointer, seed
         """
         firstToAct = gameState['firstToAct']
         nextToAct = gameState['nextToAct']
         actingOrderPointer = gameState['actingOrderPointer']
         roundNumber = gameState['roundNumber']
         roundActionNumber = gameState['roundActionNumber']
-        deck = gameState['deck']
+        seed = gameState.get('seed')
+        deck = gameState.get('deck') if seed == None else None
         deckPointer = gameState['deckPointer']
 
-        return firstToAct, nextToAct, actingOrderPointer, roundNumber, roundActionNumber, deck, deckPointer
+        return firstToAct, nextToAct, actingOrderPointer, roundNumber, roundActionNumber, deck, deckPointer, seed
 
     def interpretGameStatePlacements(self, gameState={}):
         """
@@ -119,6 +191,13 @@ class GameHandler(object):
         """
         return gameHandlerHelpers.compileGameState(self.game)
 
+    def getEncodedGameState(self):
+        """
+        Returns the compiled game state in the compact binary format (see gameStateCodec)
+        :return: str binary game state
+        """
+        return gameStateCodec.encode(self.getCompiledGameState())
+
     def getNextActionDetails(self):
         """
         Calls game object to determine next action
@@ -199,6 +278,8 @@ class GameHandler(object):
     def updateGameState(self, game_state):
         """
         Updates this object's game state with new values from param game_state
+        Only players and rows that differ from the game state this handler was hydrated from are marked as changed,
+        and rows which are the same are left alone
         :param game_state: New game state
         :return: None
         """
@@ -209,15 +290,23 @@ class GameHandler(object):
         self.game.actingOrderPointer = int(game_state['gameState']['actingOrderPointer'])
         self.game.board.deck.currentPosition = int(game_state['gameState']['deckPointer'])
 
+        oldPlayers = self.gameState.get('players', {})
+        oldPlacements = self.gameState.get('gameState', {}).get('placements', {})
         for playerNumber in game_state['players'].keys():
-            self.game.players[int(playerNumber)-1].cards = gameHandlerHelpers.convertCardsListToObj(game_state['players'][playerNumber]['cards'])
-            self.game.players[int(playerNumber)-1].score = int(game_state['players'][playerNumber]['score'])
-            self.game.board.placements[int(playerNumber)-1].bottomRow.cardPlacements = \
-                gameHandlerHelpers.convertCardsListToObj(game_state['gameState']['placements'][playerNumber]['bottomRow'])
-            self.game.board.placements[int(playerNumber)-1].middleRow.cardPlacements = \
-                gameHandlerHelpers.convertCardsListToObj(game_state['gameState']['placements'][playerNumber]['middleRow'])
-            self.game.board.placements[int(playerNumber)-1].topRow.cardPlacements = \
-                gameHandlerHelpers.convertCardsListToObj(game_state['gameState']['placements'][playerNumber]['topRow'])
+            player = self.game.players[int(playerNumber)-1]
+            newPlayer = game_state['players'][playerNumber]
+            player.cards = gameHandlerHelpers.convertCardsListToObj(newPlayer['cards'])
+            player.score = int(newPlayer['score'])
+            oldPlayer = oldPlayers.get(playerNumber, {})
+            if (oldPlayer.get('cards') != newPlayer['cards'] or oldPlayer.get('score') != newPlayer['score']):
+                self.game.markPlayersDirty([int(playerNumber)])
+
+            newRows = game_state['gameState']['placements'][playerNumber]
+            oldRows = oldPlacements.get(playerNumber, {})
+            for rowKey in ['bottomRow', 'middleRow', 'topRow']:
+                if (oldRows.get(rowKey) != newRows[rowKey] or self.game.compiledState == None):
+                    row = getattr(self.game.board.placements[int(playerNumber)-1], rowKey)
+                    row.cardPlacements = gameHandlerHelpers.convertCardsListToObj(newRows[rowKey])
 
         return "Successfully updated game state!"
 
@@ -237,3 +326,11 @@ if __name__ == "__main__":
     print "\nNow interpreting scores for this game state...\n"
     print g.game.interpretScores()
     print g.getCompiledGameState()
+
+    # A legacy state (no player ids) is compiled in full, so a nextAction must still keep every player's cards
+    legacy = gameHandlerHelpers.copyGameState(GameHandler(variant='ofc', playerCount=2).getCompiledGameState())
+    for pGs in legacy['players'].values():
+        del pGs['playerId']
+    legacy['players']['2']['cards'] = ['4H', '7H', '4C', '7C', '8H']
+    h = GameHandler(variant='ofc', playerCount=2, gameState=legacy, action='nextAction')
+    print h.getCompiledGameState()['players']['2']['cards']
@@ -41,6 +41,140 @@ def formatNextActionResponse(response):
 def compileGameState(game):
     """
     Compiles game state information into dictionary ready to be stored in database
+    The first call builds the whole dict; later calls patch only the counters, players and rows changed since
+    (see Game.markPlayersDirty and Row.dirty). The same dict is returned each time, so copy it if it must outlive
+    the next change to the game
+    :param game: game object to compile dict from
+    :return: dict Game state
+    """
+    if game.compiledState == None:
+        game.compiledState = buildGameState(game)
+    else:
+        patchGameState(game, game.compiledState)
+    game.clearDirty()
+    return game.compiledState
+
+def seedCompiledState(game, gameState):
+    """
+    Seeds a freshly hydrated game's compiled state with the dict it was hydrated from, so the first compile after
+    an action only patches what the action changed
+    Only the dicts are copied (lists are replaced, never mutated, when patched), leaving gameState itself untouched
+    Legacy states missing player ids are skipped and compiled in full instead
+    :param game: Game object hydrated from gameState
+    :param gameState: Game state dict
+    :return: True if the compiled state was seeded, False if the game will be compiled in full
+    """
+    for pGs in gameState['players'].values():
+        if 'playerId' not in pGs:
+            return False
+    if ('seed' in gameState['gameState']) != (game.seed != None):
+        return False
+
+    game.compiledState = copyGameState(gameState)
+    game.clearDirty()
+    return True
+
+def copyGameState(gameState):
+    """
+    Copies the dicts of a game state - the card lists are shared, so they must be replaced rather than mutated
+    :param gameState: dict Game state
+    :return: dict Game state
+    """
+    copied = dict(gameState)
+    copied['players'] = dict([(key, dict(pGs)) for key, pGs in gameState['players'].items()])
+    copied['gameState'] = dict(gameState['gameState'])
+    copied['gameState']['placements'] = dict([(key, dict(pGs)) for key, pGs in
+                                              gameState['gameState']['placements'].items()])
+    return copied
+
+def diffGameStates(oldState, newState):
+    """
+    Works out the changes from one game state to the next, e.g. the cards dealt by an action or the rows it placed
+    Only values that differ are included - a None game variable means the key was removed (e.g. a legacy deck)
+    :param oldState: dict Game state before
+    :param newState: dict Game state after
+    :return: dict delta with keys 'gameState' (game variables), 'players' and 'placements'
+    """
+    oldGs = oldState['gameState']
+    newGs = newState['gameState']
+    delta = {'gameState': {}, 'players': {}, 'placements': {}}
+
+    for key in set(oldGs.keys()) | set(newGs.keys()):
+        if key != 'placements' and oldGs.get(key) != newGs.get(key):
+            delta['gameState'][key] = newGs.get(key)
+
+    for section, old, new in (('players', oldState['players'], newState['players']),
+                              ('placements', oldGs['placements'], newGs['placements'])):
+        for pKey, pGs in new.items():
+            changed = dict([(key, value) for key, value in pGs.items() if old.get(pKey, {}).get(key) != value])
+            if changed:
+                delta[section][pKey] = changed
+
+    return delta
+
+def applyGameStateDelta(gameState, delta):
+    """
+    Applies a diffGameStates delta, leaving the given game state untouched
+    :param gameState: dict Game state
+    :param delta: dict delta
+    :return: dict Game state after the change
+    """
+    gameState = copyGameState(gameState)
+    gS = gameState['gameState']
+    for key, value in delta['gameState'].items():
+        if value == None:
+            gS.pop(key, None)
+        else:
+            gS[key] = value
+    for pKey, changed in delta['players'].items():
+        gameState['players'][pKey].update(changed)
+    for pKey, changed in delta['placements'].items():
+        gS['placements'][pKey].update(changed)
+    return gameState
+
+def replayGameStateDeltas(gameState, deltas):
+    """
+    :param gameState: dict Game state (e.g. a snapshot)
+    :param deltas: List of deltas recorded after gameState, oldest first
+    :return: dict Game state after every delta
+    """
+    for delta in deltas:
+        gameState = applyGameStateDelta(gameState, delta)
+    return gameState
+
+def patchGameState(game, gameState):
+    """
+    Updates a compiled game state dict in place with the counters, dirty players and dirty rows of the game
+    :param game: game object the dict was compiled from
+    :param gameState: dict Game state
+    :return: None
+    """
+    gS = gameState['gameState']
+    gS['roundNumber'] = game.roundNumber
+    gS['roundActionNumber'] = game.roundActionNumber
+    gS['firstToAct'] = game.firstToAct
+    gS['nextToAct'] = game.nextToAct
+    gS['actingOrderPointer'] = game.actingOrderPointer
+    gS['deckPointer'] = game.board.deck.currentPosition
+
+    for playerNumber in game.dirtyPlayers:
+        pGs = gameState['players'][str(playerNumber)]
+        pGs['score'] = game.players[playerNumber - 1].score
+        pGs['cards'] = convertCardsListToStr(game.players[playerNumber - 1].cards)
+
+    if not game.board.placementsLoaded():
+        # Placements never read this action, so can't have changed
+        return
+    for i in range(1, len(game.players)+1):
+        placement = game.board.placements[i-1]
+        for key, row in (('topRow', placement.topRow), ('middleRow', placement.middleRow),
+                         ('bottomRow', placement.bottomRow)):
+            if row.dirty:
+                gS['placements'][str(i)][key] = convertCardsListToStr(row.cardPlacements)
+
+def buildGameState(game):
+    """
+    Compiles the whole game state dict from scratch
     :param game: game object to compile dict from
     :return: dict Game state
     """
@@ -69,7 +203,11 @@ def compileGameState(game):
     gS['firstToAct'] = game.firstToAct
     gS['nextToAct'] = game.nextToAct
     gS['actingOrderPointer'] = game.actingOrderPointer
-    gS['deck'] = convertCardsListToStr(game.board.deck.deck)
+    if game.seed != None:
+        # Deck is regenerated from the seed and round number on load
+        gS['seed'] = game.seed
+    else:
+        gS['deck'] = convertCardsListToStr(game.board.deck.deck)
     gS['deckPointer'] = game.board.deck.currentPosition
 
     # Game state placements information
@@ -0,0 +1,271 @@
+__author__ = "Alastair Kerr"
+
+import collections
+import threading
+import time
+
+import tools
+
+
+class GameStateCache(object):
+    """
+    In-process LRU/TTL cache of game states in front of a Database, with the same get_game_state/update_game_state
+    interface so the Api can use either
+    With write behind enabled, updates only touch memory and a background thread persists changed games every
+    flush interval (and on close), so hot games only hit the database on cache misses and periodic flushes.
+    Updates are then acknowledged before they are stored - a crash loses up to flush_interval of writes - so write
+    behind is opt in, and while a game's writes are failing its updates report the error instead of succeeding
+    silently
+    Assumes this process is the only writer for the games it serves
+    """
+    def __init__(self, database, max_entries=10000, ttl=600, write_behind=False, flush_interval=0.5, lock_stripes=64):
+        """
+        :param database: Database object (anything with get_game_state and update_game_state)
+        :param max_entries: Most game states held in memory - least recently used games are dropped first
+        :param ttl: Seconds a clean entry is served before being re-read from the database (None for no expiry)
+        :param write_behind: True to defer writes to the flush thread, False to write through
+        :param flush_interval: Most seconds a changed game waits before being written when writing behind
+        :param lock_stripes: Number of per-game update locks (games share a lock when their ids hash to the same one)
+        """
+        assert max_entries > 0
+        self.database = database
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+
+        self.lock = threading.Lock()
+        self.game_locks = [threading.Lock() for i in range(lock_stripes)]
+        self.entries = collections.OrderedDict()  # game_id -> [game_state dict, time stored, version]
+        self.dirty = {}                           # game_id -> version waiting to be written
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.flush_errors = {}      # game_id -> error from its last failed write, reported to its writers until one succeeds
+        self.flush_error = None     # Error from the last flush if it failed
+        self.flush_failures = 0
+
+        self.stop_event = threading.Event()
+        self.flush_thread = None
+        if write_behind:
+            self.flush_thread = threading.Thread(target=self.flush_loop, name="GameStateCacheFlush")
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+
+    def get_game_state(self, game_id, sanitised=False):
+        """
+        Returns the game state for the given game_id, from memory if cached
+        The returned dict is shared with the cache - don't modify it
+        :param game_id: str uuid4
+        :param sanitised: True to strip the deck and seed for the frontend (a copy is returned)
+        :return: Game state
+        """
+        game_id = str(game_id)
+        game_state = None
+        with self.lock:
+            entry = self.entries.get(game_id)
+            if entry != None:
+                if self.ttl != None and game_id not in self.dirty and time.time() - entry[1] > self.ttl:
+                    del self.entries[game_id]
+                else:
+                    # Move to the most recently used end
+                    del self.entries[game_id]
+                    self.entries[game_id] = entry
+                    game_state = entry[0]
+                    self.hits += 1
+
+        if game_state == None:
+            game_state = self.database.get_game_state(game_id)
+            with self.lock:
+                self.misses += 1
+                if game_id not in self.entries:
+                    self.store(game_id, game_state)
+
+        if sanitised:
+            game_state = dict(game_state)
+            game_state['gameState'] = dict(game_state['gameState'])
+            for key in ['deck', 'seed']:
+                if key in game_state['gameState']:
+                    del game_state['gameState'][key]
+        return game_state
+
+    def update_game_state(self, game_id, game_state):
+        """
+        Stores a game state in the cache and writes it through to the database (or queues it when writing behind)
+        The cache keeps a reference to game_state, so don't modify it afterwards
+        :param game_id: uuid for this game
+        :param game_state: dictionary with game state information
+        :return: Result of the database write - when writing behind, None or the error from this game's last failed
+                 write (the update stays queued and is retried)
+        """
+        game_id = str(game_id)
+        if not self.write_behind:
+            # Write and cache as one step per game, or concurrent updates could reach the cache in a different order
+            # to the database and leave it serving the older state
+            with self.game_lock(game_id):
+                result = self.database.update_game_state(game_id, game_state)
+                with self.lock:
+                    if result:
+                        # Failed write - don't serve a state the database doesn't have
+                        self.entries.pop(game_id, None)
+                        return result
+                    self.store(game_id, game_state)
+                return result
+
+        with self.lock:
+            self.dirty[game_id] = self.store(game_id, game_state)
+            return self.flush_errors.get(game_id)
+
+    def game_lock(self, game_id):
+        """
+        :return: Lock held while writing the given game through to the database
+        """
+        return self.game_locks[hash(game_id) % len(self.game_locks)]
+
+    def store(self, game_id, game_state):
+        """
+        Puts a game state in the cache as the most recently used entry, evicting the least recently used clean
+        entries beyond max_entries - call with the lock held
+        :return: int version of the stored entry
+        """
+        self.version += 1
+        self.entries.pop(game_id, None)
+        self.entries[game_id] = [game_state, time.time(), self.version]
+
+        if len(self.entries) > self.max_entries:
+            for key in list(self.entries.keys()):
+                if len(self.entries) <= self.max_entries:
+                    break
+                # Unwritten games stay until flushed
+                if key not in self.dirty and key != game_id:
+                    del self.entries[key]
+        return self.version
+
+    def flush(self):
+        """
+        Writes every changed game state to the database - in one multi-row write if the database supports it
+        Games changed again while being written stay queued for the next flush, and failed writes are retried
+        :return: int number of games written
+        """
+        with self.lock:
+            pending = [(game_id, version, self.entries[game_id][0]) for game_id, version in self.dirty.items()]
+        if not pending:
+            return 0
+
+        error = None
+        failed = {}     # game_id -> error
+        if hasattr(self.database, 'update_game_states'):
+            result = self.write(self.database.update_game_states,
+                                [(game_id, game_state) for game_id, version, game_state in pending])
+            if result:
+                error = "GameStateCache failed to write %i games: %s" % (len(pending), result)
+                failed = dict([(game_id, error) for game_id, version, game_state in pending])
+            written = [] if result else pending
+        else:
+            written = []
+            for game_id, version, game_state in pending:
+                result = self.write(self.database.update_game_state, game_id, game_state)
+                if result:
+                    error = failed[game_id] = "GameStateCache failed to write game id '%s': %s" % (game_id, result)
+                    continue
+                written.append((game_id, version, game_state))
+
+        if error:
+            tools.write_error(error)
+        with self.lock:
+            for game_id, version, game_state in written:
+                self.flush_errors.pop(game_id, None)
+                if self.dirty.get(game_id) == version:
+                    del self.dirty[game_id]
+            self.flush_errors.update(failed)
+            self.flush_error = error
+            if error:
+                self.flush_failures += 1
+        return len(written)
+
+    def write(self, function, *args):
+        """
+        Calls a database write, turning exceptions into error results like the Database's own
+        :return: Result of the write
+        """
+        try:
+            return function(*args)
+        except Exception, e:
+            return "%s: %s" % (tools.get_formatted_datetime(), e)
+
+    def flush_loop(self):
+        """
+        Flush thread - writes changed games every flush interval until closed
+        :return: None
+        """
+        while not self.stop_event.is_set():
+            self.stop_event.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception, e:
+                tools.write_error("GameStateCache flush failed: %s" % e)
+
+    def close(self):
+        """
+        Stops the flush thread and writes anything still queued - call on shutdown
+        Raises IOError if any games couldn't be written, so the loss isn't silent
+        :return: None
+        """
+        self.stop_event.set()
+        if self.flush_thread != None:
+            self.flush_thread.join()
+            self.flush_thread = None
+        self.flush()
+        with self.lock:
+            unwritten = len(self.dirty)
+        if unwritten:
+            raise IOError("GameStateCache closed with %i game states unwritten: %s" % (unwritten, self.flush_error))
+
+    def stats(self):
+        """
+        :return: Dict with entries held, games waiting to be written, hits, misses, failed flushes, games whose last
+                 write failed and the last flush error (None if the last flush succeeded)
+        """
+        with self.lock:
+            return {'entries': len(self.entries), 'dirty': len(self.dirty), 'hits': self.hits, 'misses': self.misses,
+                    'flush_failures': self.flush_failures, 'failing': len(self.flush_errors),
+                    'flush_error': self.flush_error}
+
+
+if __name__ == "__main__":
+    # Testing functionality - write behind in front of a stand-in database
+    class MemoryDatabase(object):
+        def __init__(self):
+            self.rows = {}
+            self.writes = 0
+
+        def get_game_state(self, game_id, sanitised=False):
+            return self.rows[game_id]
+
+        def update_game_state(self, game_id, game_state):
+            self.writes += 1
+            self.rows[game_id] = game_state
+
+    db = MemoryDatabase()
+    cache = GameStateCache(db, max_entries=2, write_behind=True, flush_interval=0.05)
+    for i in range(0, 100):
+        cache.update_game_state('game-%i' % (i % 3), {'gameState': {'deckPointer': i, 'seed': 1}})
+    print cache.get_game_state('game-0', sanitised=True), cache.stats()
+    cache.close()
+    print "Database writes for 100 updates: %i" % db.writes, sorted(db.rows.keys())
+
+    # A failing game is reported to its own writers and on close rather than dropped - other games are unaffected
+    def failing_write(game_id, game_state, write=db.update_game_state):
+        if game_id == 'game-3':
+            return "Database down"
+        return write(game_id, game_state)
+    db.update_game_state = failing_write
+    cache = GameStateCache(db, write_behind=True, flush_interval=0.01)
+    cache.update_game_state('game-3', {'gameState': {}})
+    time.sleep(0.05)
+    print cache.update_game_state('game-3', {'gameState': {}}), cache.update_game_state('game-4', {'gameState': {}}), \
+        cache.stats()['flush_failures'] > 0
+    try:
+        cache.close()
+    except IOError, e:
+        print e
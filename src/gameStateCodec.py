@@ -0,0 +1,210 @@
+__author__ = 'Alastair Kerr'
+
+import binascii
+import struct
+
+from card import CARD_STRINGS, Card
+import tools
+
+# Binary game states start with a magic prefix that can't begin a str(dict) literal, followed by the format version
+MAGIC = '\x89OFC'
+VERSION = 1
+
+VARIANTS = ('ofc', 'pineapple')
+EMPTY_SLOT = 0xFF
+EMPTY_BYTE = chr(EMPTY_SLOT)
+ROW_SLOTS = (('bottomRow', 5), ('middleRow', 5), ('topRow', 3))
+
+# Flags byte - which optional sections follow the header
+FLAG_SEED = 1
+FLAG_DECK = 2
+FLAG_PLAYER_IDS = 4
+
+# magic, version, variant, playerCount, roundNumber, roundActionNumber, firstToAct, nextToAct, actingOrderPointer,
+# deckPointer, flags
+HEADER = struct.Struct('!4sBBBHBBBBBB')
+SEED = struct.Struct('!Q')
+SCORE = struct.Struct('!i')
+
+
+def isEncoded(data):
+    """
+    :param data: Stored game state - binary encoding or str(dict) literal
+    :return: True if data is a binary encoded game state
+    """
+    return data[:len(MAGIC)] == MAGIC
+
+def encodeCards(cards):
+    """
+    :param cards: List of card strings
+    :return: str of one byte card ids
+    """
+    return ''.join([chr(Card(c)) for c in cards])
+
+def uuidToBytes(playerId):
+    """
+    :param playerId: uuid string e.g. as made by Game.createPlayerIds
+    :return: 16 byte str
+    """
+    packed = binascii.unhexlify(playerId.replace('-', ''))
+    if len(packed) != 16:
+        raise ValueError("Invalid player id: %r" % (playerId,))
+    return packed
+
+def bytesToUuid(packed):
+    """
+    Formats 16 bytes as a uuid string (quicker than going through uuid.UUID)
+    :param packed: 16 byte str
+    :return: uuid string
+    """
+    h = binascii.hexlify(packed)
+    return '%s-%s-%s-%s-%s' % (h[0:8], h[8:12], h[12:16], h[16:20], h[20:32])
+
+def encode(gameState):
+    """
+    Packs a compiled game state (see gameHandlerHelpers.compileGameState) into the compact binary format:
+    a fixed header, the seed (8 bytes) or deck (52 byte permutation), then per player a 16 byte uuid,
+    score, hand cards and 13 placement slots (one byte card ids, 0xFF for empty)
+    :param gameState: Game state dict
+    :return: str binary game state
+    """
+    gS = gameState['gameState']
+    playerCount = gameState['playerCount']
+    players = [gameState['players'][str(i)] for i in range(1, playerCount + 1)]
+
+    flags = 0
+    if gS.get('seed') != None:
+        flags |= FLAG_SEED
+    if gS.get('deck') != None:
+        flags |= FLAG_DECK
+    if 'playerId' in players[0]:
+        flags |= FLAG_PLAYER_IDS
+
+    parts = [HEADER.pack(MAGIC, VERSION, VARIANTS.index(gameState['variant']), playerCount, gS['roundNumber'],
+                         gS['roundActionNumber'], gS['firstToAct'], gS['nextToAct'], gS['actingOrderPointer'],
+                         gS['deckPointer'], flags)]
+    if flags & FLAG_SEED:
+        parts.append(SEED.pack(gS['seed']))
+    if flags & FLAG_DECK:
+        assert len(gS['deck']) == 52
+        parts.append(encodeCards(gS['deck']))
+
+    for i in range(1, playerCount + 1):
+        player = players[i - 1]
+        if flags & FLAG_PLAYER_IDS:
+            parts.append(uuidToBytes(player['playerId']))
+        parts.append(SCORE.pack(player['score']))
+        parts.append(chr(len(player['cards'])) + encodeCards(player['cards']))
+
+        placements = gS['placements'][str(i)]
+        for rowKey, size in ROW_SLOTS:
+            row = placements[rowKey]
+            if len(row) > size:
+                raise ValueError("Too many cards in %s for player %i!" % (rowKey, i))
+            parts.append(encodeCards(row) + EMPTY_BYTE * (size - len(row)))
+
+    return ''.join(parts)
+
+def decode(data):
+    """
+    Unpacks a binary game state into the dict GameHandler hydrates from (same form as compileGameState)
+    :param data: str binary game state
+    :return: Game state dict
+    """
+    (magic, version, variant, playerCount, roundNumber, roundActionNumber, firstToAct, nextToAct,
+     actingOrderPointer, deckPointer, flags) = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a binary game state!")
+    if version != VERSION:
+        raise ValueError("Unsupported game state version %i!" % version)
+
+    raw = bytearray(data)
+    cardString = CARD_STRINGS.__getitem__
+    position = HEADER.size
+    gS = {'roundNumber': roundNumber,
+          'roundActionNumber': roundActionNumber,
+          'firstToAct': firstToAct,
+          'nextToAct': nextToAct,
+          'actingOrderPointer': actingOrderPointer,
+          'deckPointer': deckPointer,
+          'placements': {}}
+    if flags & FLAG_SEED:
+        gS['seed'] = SEED.unpack_from(data, position)[0]
+        position += SEED.size
+    if flags & FLAG_DECK:
+        gS['deck'] = map(cardString, raw[position:position + 52])
+        position += 52
+
+    players = {}
+    for i in range(1, playerCount + 1):
+        pKey = str(i)
+        player = {'playerNumber': i}
+        if flags & FLAG_PLAYER_IDS:
+            player['playerId'] = bytesToUuid(data[position:position + 16])
+            position += 16
+        player['score'] = SCORE.unpack_from(data, position)[0]
+        position += SCORE.size
+        count = raw[position]
+        player['cards'] = map(cardString, raw[position + 1:position + 1 + count])
+        position += 1 + count
+        players[pKey] = player
+
+        placements = {'playerNumber': i}
+        for rowKey, size in ROW_SLOTS:
+            # Rows are written left-packed, so the cards end at the first empty slot
+            end = data.find(EMPTY_BYTE, position, position + size)
+            placements[rowKey] = map(cardString, raw[position:end if end != -1 else position + size])
+            position += size
+        gS['placements'][pKey] = placements
+
+    return {'playerCount': playerCount,
+            'variant': VARIANTS[variant],
+            'players': players,
+            'gameState': gS}
+
+def loadGameState(data):
+    """
+    Reads a stored game state in either format - binary states are decoded, older str(dict) states literal_eval'd
+    :param data: Stored game state
+    :return: Game state dict
+    """
+    if isEncoded(data):
+        return decode(data)
+    return tools.load_dictionary_from_string(data)
+
+
+if __name__ == "__main__":
+    # Testing functionality - round trip a game state and compare with the literal format
+    import time
+    from gameHandler import GameHandler
+
+    g = GameHandler(variant='ofc', playerCount=4)
+    for i in range(0, 6):
+        g.getNextActionDetails()
+    state = g.getCompiledGameState()
+
+    data = encode(state)
+    literal = str(state)
+    print decode(data) == state, isEncoded(data), isEncoded(literal)
+
+    # Seeds outside the unsigned 64 bit range are normalised by Game, so their states still round trip
+    from game import Game
+    for seed in [-1, 2 ** 70, 'table-7', 0, 2 ** 64 - 1]:
+        g = GameHandler(variant='ofc', playerCount=2)
+        g.game = Game(playerCount=2, seed=seed)
+        g.getNextActionDetails()
+        seededState = g.getCompiledGameState()
+        rebuilt = GameHandler(variant='ofc', playerCount=2, gameState=decode(encode(seededState)))
+        print "Seed %r: round trip %s, same deck %s" % \
+              (seed, decode(encode(seededState)) == seededState, rebuilt.game.board.deck.deck == g.game.board.deck.deck)
+    print "Binary %i bytes, literal %i bytes" % (len(data), len(literal))
+
+    start = time.time()
+    for i in range(0, 1000):
+        decode(data)
+    decodeTime = time.time() - start
+    start = time.time()
+    for i in range(0, 1000):
+        tools.load_dictionary_from_string(literal)
+    literalTime = time.time() - start
+    print "Decode %.1fus, literal_eval %.1fus (%.1fx)" % (decodeTime * 1000, literalTime * 1000, literalTime / decodeTime)
@@ -0,0 +1,264 @@
+__author__ = 'Alastair Kerr'
+
+import itertools
+
+from placement import Placement
+from placementEngine import rowsFromPlacement, legalPlacements, applyOption, describeOption, unseenCards, ROW_SIZES
+import scorer
+
+
+class OpponentOutcomes(object):
+    def __init__(self, opponentRows, deck):
+        """
+        Every way the opponents' empty slots can be filled together from the unseen cards (no card goes to two
+        opponents), grouped per opponent by scored outcome
+        The number of ways the other opponents can fill their slots only depends on how many unseen cards are left,
+        so each opponent's own completions are scored once and weighted by that count, instead of listing every joint
+        completion. Many completions score identically (suits rarely matter), so expectations are summed per outcome
+        :param opponentRows: List of each opponent's [bottom, middle, top] lists of card ids
+        :param deck: List of unseen card ids
+        :return: None
+        """
+        self.deckSize = len(deck)
+        self.missing = [[ROW_SIZES[i] - len(rows[i]) for i in range(0, 3)] for rows in opponentRows]
+        self.completions = []     # Per opponent [(frozenset of card ids used, evaluateRows result)]
+        self.counts = []          # Per opponent {result -> number of its own completions}
+        self.countsWithCard = {}  # card id -> per opponent {result -> number of its own completions using that card}
+        self.pointsMemo = {}
+
+        for index in range(0, len(opponentRows)):
+            rows = opponentRows[index]
+            completions = []
+            counts = {}
+            for used, completed in self.enumerateCompletions(rows, deck):
+                result = scorer.evaluateRows(completed[0], completed[1], completed[2])
+                completions.append((used, result))
+                counts[result] = counts.get(result, 0) + 1
+                for c in used:
+                    byOpponent = self.countsWithCard.get(c)
+                    if byOpponent == None:
+                        byOpponent = self.countsWithCard[c] = [{} for r in opponentRows]
+                    byOpponent[index][result] = byOpponent[index].get(result, 0) + 1
+            self.completions.append(completions)
+            self.counts.append(counts)
+
+        # Number of joint completions
+        self.total = self.fillCount(self.missing, self.deckSize)
+
+    def enumerateCompletions(self, rows, deck):
+        """
+        Generates every completion of the rows - positions within a row don't matter, so each row takes a combination
+        :return: Generator of (frozenset of card ids used, [bottom, middle, top] completed lists)
+        """
+        missing = [ROW_SIZES[i] - len(rows[i]) for i in range(0, 3)]
+        for bottomExtra in itertools.combinations(deck, missing[0]):
+            rest = [c for c in deck if c not in bottomExtra]
+            for middleExtra in itertools.combinations(rest, missing[1]):
+                rest2 = [c for c in rest if c not in middleExtra]
+                for topExtra in itertools.combinations(rest2, missing[2]):
+                    used = frozenset(bottomExtra + middleExtra + topExtra)
+                    yield used, [rows[0] + list(bottomExtra), rows[1] + list(middleExtra), rows[2] + list(topExtra)]
+
+    def fillCount(self, missing, available):
+        """
+        :param missing: List of [bottom, middle, top] empty slot counts, one per opponent
+        :param available: int number of cards to fill them from
+        :return: int number of ways to fill every slot without sharing cards
+        """
+        ways = 1
+        for rowMissing in missing:
+            for m in rowMissing:
+                if m > available:
+                    return 0
+                ways *= choose(available, m)
+                available -= m
+        return ways
+
+    def othersCount(self, index, available):
+        """
+        :return: int number of ways every opponent but index can fill their slots from the given number of cards
+        """
+        return self.fillCount(self.missing[:index] + self.missing[index + 1:], available)
+
+    def sumPoints(self, heroResult, counts):
+        """
+        :return: int total points the hero wins over the given outcome counts
+        """
+        return sum([count * scorer.pairPoints(heroResult, result) for result, count in counts.iteritems()])
+
+    def expectedPoints(self, heroResult, excluded=()):
+        """
+        Exact expected points the hero wins from all opponents, over the joint completions not using the excluded cards
+        An opponent completion avoiding the excluded cards is part of as many joint completions as the others can fill
+        from the cards left over
+        :param heroResult: evaluateRows result for the hero's finished rows
+        :param excluded: Tuple of card ids the hero was dealt after the opponents' boards were read
+        :return: float expected points
+        """
+        if not self.missing:
+            return 0.0
+
+        points = 0
+        ownCounts = []  # Per opponent, number of its own completions avoiding the excluded cards
+        for index in range(0, len(self.missing)):
+            if len(excluded) > 1:
+                # Uncommon (2+ future hero cards) - filter the completions directly
+                excludedSet = set(excluded)
+                valid = [result for used, result in self.completions[index] if used.isdisjoint(excludedSet)]
+                opponentPoints = sum([scorer.pairPoints(heroResult, result) for result in valid])
+                count = len(valid)
+            else:
+                key = (heroResult, index, None)
+                if key not in self.pointsMemo:
+                    self.pointsMemo[key] = self.sumPoints(heroResult, self.counts[index])
+                opponentPoints = self.pointsMemo[key]
+                count = len(self.completions[index])
+
+                if excluded:
+                    # Completions avoiding the card = all completions minus those using it
+                    card = excluded[0]
+                    withCard = self.countsWithCard.get(card, [{}] * len(self.missing))[index]
+                    key = (heroResult, index, card)
+                    if key not in self.pointsMemo:
+                        self.pointsMemo[key] = self.sumPoints(heroResult, withCard)
+                    opponentPoints -= self.pointsMemo[key]
+                    count -= sum(withCard.itervalues())
+
+            others = self.othersCount(index, self.deckSize - len(excluded) - sum(self.missing[index]))
+            points += opponentPoints * others
+            ownCounts.append(count * others)
+
+        # Every opponent's weighted count is the number of joint completions avoiding the excluded cards
+        return float(points) / ownCounts[0]
+
+
+def choose(n, k):
+    """
+    :return: int n choose k
+    """
+    if k < 0 or k > n:
+        return 0
+    result = 1
+    for i in range(0, k):
+        result = result * (n - i) // (i + 1)
+    return result
+
+
+class LateStreetSolver(object):
+    def __init__(self, placement, cards, deadCards=[], opponentPlacements=[]):
+        """
+        Exact solver for the last streets (roundActionNumber 8 and 9), where so few cards remain that every
+        card sequence can be enumerated instead of sampled
+        Opponent slots are filled with every combination of unseen cards, and the hero picks the best slot for each
+        future card once it is known; evaluations are memoised and shared across branches
+        :param placement: Placement object for the acting player
+        :param cards: List of Card objects dealt to the player and not yet placed
+        :param deadCards: List of other Card objects known to be out of the deck
+        :param opponentPlacements: List of Placement objects for the other players
+        :return: None
+        """
+        assert isinstance(placement, Placement)
+
+        self.rows = rowsFromPlacement(placement)
+        self.cards = list(cards)
+        opponentRows = [rowsFromPlacement(p) for p in opponentPlacements]
+
+        dead = list(cards) + list(deadCards)
+        for r in [self.rows] + opponentRows:
+            dead += r[0] + r[1] + r[2]
+        self.deck = unseenCards(dead)
+
+        self.opponents = OpponentOutcomes(opponentRows, self.deck) if opponentRows else None
+        self.heroMemo = {}
+
+    def evaluateFinal(self, rows, excluded):
+        """
+        Exact value of a finished hero board
+        :return: (expected points, foul probability, expected royalties)
+        """
+        key = tuple([tuple(sorted(r)) for r in rows])
+        result = self.heroMemo.get(key)
+        if result == None:
+            result = scorer.evaluateRows(rows[0], rows[1], rows[2])
+            self.heroMemo[key] = result
+
+        points = self.opponents.expectedPoints(result, excluded) if self.opponents != None else 0.0
+        return (points, 1.0 if result[0] else 0.0, float(result[2]))
+
+    def expectation(self, rows, excluded=()):
+        """
+        Expected value of a hero board with the remaining hero cards still to come, playing each one optimally
+        :param rows: Hero's [bottom, middle, top] lists of card ids
+        :param excluded: Tuple of future hero card ids already dealt in this branch
+        :return: (expected points, foul probability, expected royalties)
+        """
+        if len(rows[0]) + len(rows[1]) + len(rows[2]) == 13:
+            return self.evaluateFinal(rows, excluded)
+
+        totals = [0.0, 0.0, 0.0]
+        candidates = [c for c in self.deck if c not in excluded]
+        for c in candidates:
+            best = None
+            for option in legalPlacements(rows, [c]):
+                value = self.expectation(applyOption(rows, [c], option), excluded + (c,))
+                if best == None or value[0] > best[0]:
+                    best = value
+            for i in range(0, 3):
+                totals[i] += best[i]
+        return tuple([total / len(candidates) for total in totals])
+
+    def solve(self):
+        """
+        Exact expected value of every legal placement of the dealt cards
+        :return: List of dicts sorted best first, with keys 'option', 'placement', 'ev', 'foulRate' and 'royalties'
+                 (same form as PlacementEngine.evaluate)
+        """
+        options = legalPlacements(self.rows, self.cards)
+        if not options:
+            raise ValueError("No legal placements for the given cards!")
+
+        evaluations = []
+        for option in options:
+            ev, foulRate, royalties = self.expectation(applyOption(self.rows, self.cards, option))
+            evaluations.append({'option': option,
+                                'placement': describeOption(self.cards, option),
+                                'ev': ev,
+                                'foulRate': foulRate,
+                                'royalties': royalties})
+
+        evaluations.sort(key=lambda e: e['ev'], reverse=True)
+        return evaluations
+
+
+def solveLateStreet(placement, cards, deadCards=[], opponentPlacements=[]):
+    """
+    Convenience wrapper - see LateStreetSolver
+    :return: List of option dicts sorted best first
+    """
+    return LateStreetSolver(placement, cards, deadCards, opponentPlacements).solve()
+
+
+if __name__ == "__main__":
+    # Testing functionality - play a 2 player game up to the 12th card and solve the placement exactly
+    import time
+    from game import Game
+
+    g = Game(playerCount=2)
+    for i in range(0, 14):
+        playerNumber, roundActionNumber, cards = g.handleNextAction()
+        placement = g.board.placements[playerNumber - 1]
+        for card in cards:
+            # Spread cards over the rows so the final decision is a real choice
+            rows = rowsFromPlacement(placement)
+            free = [i for i in range(0, 3) if len(rows[i]) < ROW_SIZES[i]]
+            rowIndex = free[len(rows[0] + rows[1] + rows[2]) % len(free)]
+            row = [placement.bottomRow, placement.middleRow, placement.topRow][rowIndex]
+            row.setPlacement(c=card, position=len(rows[rowIndex]) + 1)
+
+    playerNumber, roundActionNumber, cards = g.handleNextAction()
+    start = time.time()
+    evaluations = solveLateStreet(g.board.placements[playerNumber - 1], cards,
+                                  opponentPlacements=[g.board.placements[2 - playerNumber]])
+    print "Round action %i solved in %.1fms" % (roundActionNumber, (time.time() - start) * 1000)
+    for e in evaluations:
+        print "%s: ev %.3f, foul rate %.3f" % ([(c.card, row) for c, row in e['placement']], e['ev'], e['foulRate'])
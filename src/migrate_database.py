@@ -0,0 +1,123 @@
+__author__ = "Alastair Kerr"
+
+import argparse
+
+from database_handler import Database
+from storage_backends import MySQLBackend
+import gameStateCodec
+import tools
+
+# Target games schema (see build/mysql/files/create_ofc_db.sql.template) - column name -> definition added if missing
+NEW_COLUMNS = [
+    ('version', "INT UNSIGNED NOT NULL DEFAULT 1"),
+    ('created_at', "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+    ('updated_at', "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+]
+
+
+def run(db, query, params=None, rowcount=False):
+    """
+    Executes a migration query, stopping the migration on error
+    :param db: Database object
+    :param rowcount: True to return the number of rows changed instead of the rows fetched
+    :return: Result of query
+    """
+    result = db.execute_query(query, params, rowcount)
+    if isinstance(result, basestring):
+        raise RuntimeError("Migration query failed: %s\n%s" % (query, result))
+    return result
+
+def existing_columns(db):
+    """
+    :return: Dict column name -> data type for the games table
+    """
+    rows = run(db, "SELECT column_name, data_type FROM information_schema.columns "
+                   "WHERE table_schema = DATABASE() AND table_name = 'games'")
+    return dict([(name.lower(), data_type.lower()) for name, data_type in rows])
+
+def migrate_schema(db):
+    """
+    Brings the games table up to the indexed, binary capable schema:
+    unique game_id (duplicate rows from the old read-then-insert writes are dropped, keeping the newest),
+    MEDIUMBLOB game_state, a version column bumped on every write and created/updated timestamps
+    Safe to run again - only missing changes are made. MySQL only (the SQLite backend creates the new schema itself)
+    :return: List of changes made
+    """
+    changes = []
+    columns = existing_columns(db)
+    unique = db.backend.has_unique_game_id()
+
+    if not unique:
+        # A row with several newer duplicates joins once per duplicate, but is only deleted once
+        deleted = run(db, "SELECT COUNT(DISTINCT g1.id) FROM games g1 JOIN games g2 ON g1.game_id = g2.game_id AND g1.id < g2.id")
+        run(db, "DELETE g1 FROM games g1 JOIN games g2 ON g1.game_id = g2.game_id AND g1.id < g2.id")
+        changes.append("removed %i duplicate game rows" % deleted[0][0])
+
+    alterations = []
+    if columns.get('game_state') != 'mediumblob':
+        alterations.append("MODIFY game_state MEDIUMBLOB NOT NULL")
+    for name, definition in NEW_COLUMNS:
+        if name not in columns:
+            alterations.append("ADD COLUMN %s %s" % (name, definition))
+    if not unique:
+        alterations.append("MODIFY game_id VARCHAR(40) NOT NULL")
+        alterations.append("ADD UNIQUE KEY game_id (game_id)")
+    if alterations:
+        # One ALTER so the table is only rebuilt once
+        run(db, "ALTER TABLE games %s" % ", ".join(alterations))
+        changes.extend(alterations)
+
+    return changes
+
+def convert_rows(db, batch_size=500):
+    """
+    Re-encodes literal str(dict) game states in the compact binary format (see gameStateCodec), in id order
+    batches so the table is never locked for long. Versions and updated_at are left as they were
+    :param batch_size: Rows read per query
+    :return: (rows converted, rows left as they were because they couldn't be encoded)
+    """
+    converted, failed = 0, 0
+    last_id = 0
+    while True:
+        rows = db.scan_game_states(last_id, batch_size)
+        if not rows:
+            break
+        for row_id, game_id, game_state in rows:
+            last_id = row_id
+            if gameStateCodec.isEncoded(game_state):
+                continue
+            try:
+                encoded = gameStateCodec.encode(tools.load_dictionary_from_string(game_state))
+            except Exception, e:
+                tools.write_error("Migration left game id '%s' unconverted: %s" % (game_id, e))
+                failed += 1
+                continue
+            # Only rewrite rows nobody has written since they were read (rows written since are left uncounted)
+            updated = run(db, "UPDATE games SET game_state = %s, updated_at = updated_at WHERE id = %s AND "
+                              "game_state = %s", (encoded, row_id, game_state), rowcount=True)
+            if updated > 0:
+                converted += 1
+
+    return converted, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the games table to the indexed, binary game state schema")
+    parser.add_argument('--skip-convert', action='store_true',
+                        help="only change the schema, leaving stored game states in their current format")
+    parser.add_argument('--batch-size', type=int, default=500, help="rows converted per batch")
+    parser.add_argument('--backend', default=None, help="storage backend to migrate (default from config)")
+    args = parser.parse_args()
+
+    db = Database(pool_size=1, backend=args.backend)
+    if isinstance(db.backend, MySQLBackend):
+        for change in migrate_schema(db):
+            print "Schema: %s" % change
+
+    if not args.skip_convert:
+        converted, failed = convert_rows(db, batch_size=args.batch_size)
+        print "Converted %i game states to the binary format (%i left unconverted, see error logs)" % (converted, failed)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,8 @@ class Pineapple(Game):
     """
 
     def __init__(self, playerCount=2, firstToAct=1, nextToAct=1, actingOrderPointer=0, roundNumber=1, \
-                 variant='pineapple', roundActionNumber=1, deck=None, deckPointer=0):
+                 variant='pineapple', roundActionNumber=1, deck=None, deckPointer=0, seed=None, playerIds=None, \
+                 placementsLoader=None):
         """
         Initialise - pineapple can be played with max 3 players. If this is OK call super constructor
         :return: None
@@ -18,7 +19,8 @@ class Pineapple(Game):
             raise ValueError("Pineapple OFCP can have a maximum of 3 players!")
         super(Pineapple, self).__init__(playerCount=self.playerCount, firstToAct=firstToAct, nextToAct=nextToAct, \
                             actingOrderPointer=actingOrderPointer, roundNumber=roundNumber, roundActionNumber=roundActionNumber, \
-                            deck=deck, deckPointer=deckPointer,variant='pineapple')
+                            deck=deck, deckPointer=deckPointer,variant='pineapple', seed=seed, playerIds=playerIds, \
+                            placementsLoader=placementsLoader)
 
     # TODO pineapple ofc specific game logic functions/ implementation
 
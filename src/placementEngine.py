@@ -0,0 +1,251 @@
+__author__ = 'Alastair Kerr'
+
+import itertools
+import multiprocessing
+import random
+import time
+
+from card import Card
+from placement import Placement
+import scorer
+
+ROW_NAMES = ('Bottom', 'Middle', 'Top')
+ROW_SIZES = (5, 5, 3)
+
+# Rollouts run between deadline checks
+ROLLOUT_BATCH = 16
+
+
+def rowsFromPlacement(placement):
+    """
+    Reads a Placement into plain lists of card ids, the form used for fast rollouts
+    :param placement: Placement object
+    :return: [bottom card ids, middle card ids, top card ids] (empty slots left out)
+    """
+    assert isinstance(placement, Placement)
+    return [[c for c in row.cardPlacements if c != None]
+            for row in (placement.bottomRow, placement.middleRow, placement.topRow)]
+
+def legalPlacements(rows, cards):
+    """
+    Enumerate every way of placing the given cards into the rows' free slots
+    :param rows: [bottom, middle, top] lists of card ids already placed
+    :param cards: List of Card objects to place
+    :return: List of tuples of row indices (0 bottom, 1 middle, 2 top), one per card
+    """
+    free = [ROW_SIZES[i] - len(rows[i]) for i in range(0, 3)]
+    options = []
+    for option in itertools.product(range(0, 3), repeat=len(cards)):
+        if all([option.count(i) <= free[i] for i in range(0, 3)]):
+            options.append(option)
+    return options
+
+def applyOption(rows, cards, option):
+    """
+    Places cards into copies of the rows following a legalPlacements option
+    :return: New [bottom, middle, top] lists of card ids
+    """
+    newRows = [list(rows[0]), list(rows[1]), list(rows[2])]
+    for card, rowIndex in zip(cards, option):
+        newRows[rowIndex].append(card)
+    return newRows
+
+def describeOption(cards, option):
+    """
+    :return: List of (Card object, row name) pairs for a legalPlacements option
+    """
+    return [(Card(card), ROW_NAMES[rowIndex]) for card, rowIndex in zip(cards, option)]
+
+def placeOption(placement, cards, option):
+    """
+    Applies a legalPlacements option to a Placement, filling each row's first empty positions
+    :param placement: Placement object
+    :param cards: List of Card objects
+    :param option: Tuple of row indices, one per card
+    :return: None
+    """
+    rows = (placement.bottomRow, placement.middleRow, placement.topRow)
+    for card, rowIndex in zip(cards, option):
+        row = rows[rowIndex]
+        row.setPlacement(c=card, position=row.cardPlacements.index(None) + 1)
+
+def unseenCards(deadCards):
+    """
+    :param deadCards: Iterable of card ids which can't be dealt
+    :return: List of the remaining card ids
+    """
+    dead = set(deadCards)
+    return [cardId for cardId in range(0, 52) if cardId not in dead]
+
+def completeRows(rows, deck, position):
+    """
+    Randomly complete rows by filling their empty slots from a shuffled deck
+    :param rows: [bottom, middle, top] lists of card ids
+    :param deck: Shuffled list of card ids
+    :param position: Index of the next card to take from deck
+    :return: (scorer.evaluateRows result for the completed rows, new deck position)
+    """
+    bottomMissing = 5 - len(rows[0])
+    middleMissing = 5 - len(rows[1])
+    topMissing = 3 - len(rows[2])
+    bottom = rows[0] + deck[position:position + bottomMissing]
+    position += bottomMissing
+    middle = rows[1] + deck[position:position + middleMissing]
+    position += middleMissing
+    top = rows[2] + deck[position:position + topMissing]
+    position += topMissing
+    return scorer.evaluateRows(bottom, middle, top), position
+
+def runRollouts(task):
+    """
+    Worker function: plays random completions for every option against the same shuffled decks
+    (common random numbers), until the rollout count or the wall-clock deadline is reached
+    :param task: (optionRows, opponentRows, unseen card ids, int rollouts, float deadline or None, int seed)
+    :return: (rollouts played, [[points, fouls, royalties, row wins] summed per option])
+    """
+    optionRows, opponentRows, deck, rollouts, deadline, seed = task
+    rng = random.Random(seed)
+    deck = list(deck)
+    totals = [[0, 0, 0, 0] for option in optionRows]
+
+    played = 0
+    while played < rollouts:
+        if deadline != None and time.time() >= deadline:
+            break
+        for i in xrange(0, min(ROLLOUT_BATCH, rollouts - played)):
+            rng.shuffle(deck)
+            # Opponents are completed first, so each option sees the same opponent boards
+            position = 0
+            opponents = []
+            for rows in opponentRows:
+                result, position = completeRows(rows, deck, position)
+                opponents.append(result)
+
+            for optionIndex in xrange(0, len(optionRows)):
+                hero = completeRows(optionRows[optionIndex], deck, position)[0]
+                total = totals[optionIndex]
+                for opponent in opponents:
+                    total[0] += scorer.pairPoints(hero, opponent)
+                    for h, o in zip(hero[1], opponent[1]):
+                        if h > o:
+                            total[3] += 1
+                if hero[0]:
+                    total[1] += 1
+                total[2] += hero[2]
+            played += 1
+
+    return played, totals
+
+
+class PlacementEngine(object):
+    def __init__(self, workers=None, rollouts=2000, timeLimit=0.5):
+        """
+        Monte Carlo placement engine - estimates the expected points of each legal placement of the cards
+        just dealt by randomly completing the remaining streets for every player
+        Rollouts run on a process pool which is created once and reused for every decision
+        :param workers: Number of worker processes (None for one per CPU, 0 to run in this process)
+        :param rollouts: Default rollout budget per decision
+        :param timeLimit: Default wall-clock budget per decision in seconds (None for no limit)
+        :return: None
+        """
+        assert workers == None or workers >= 0
+        self.rollouts = rollouts
+        self.timeLimit = timeLimit
+        self.workers = workers if workers != None else multiprocessing.cpu_count()
+        self.pool = None
+        if self.workers > 0:
+            self.pool = multiprocessing.Pool(self.workers)
+
+    def close(self):
+        """
+        Shut down the worker pool
+        :return: None
+        """
+        if self.pool != None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def evaluate(self, placement, cards, deadCards=[], opponentPlacements=[], rollouts=None, timeLimit=None):
+        """
+        Estimate the expected value of every legal placement of the given cards
+        :param placement: Placement object for the acting player
+        :param cards: List of Card objects dealt to the player and not yet placed
+        :param deadCards: List of other Card objects known to be out of the deck (e.g. discards)
+        :param opponentPlacements: List of Placement objects for the other players
+        :param rollouts: Rollout budget (defaults to the engine's)
+        :param timeLimit: Wall-clock budget in seconds (defaults to the engine's)
+        :return: List of dicts sorted best first, with keys 'option' (row index per card), 'placement'
+                 ([(Card, row name)]), 'ev' (expected points vs all opponents), 'foulRate', 'royalties',
+                 'rowWins' (expected rows won per opponent) and 'rollouts'
+        """
+        assert isinstance(placement, Placement)
+        rollouts = rollouts if rollouts != None else self.rollouts
+        timeLimit = timeLimit if timeLimit != None else self.timeLimit
+        deadline = time.time() + timeLimit if timeLimit != None else None
+
+        rows = rowsFromPlacement(placement)
+        opponentRows = [rowsFromPlacement(p) for p in opponentPlacements]
+        options = legalPlacements(rows, cards)
+        if not options:
+            raise ValueError("No legal placements for the given cards!")
+        optionRows = [applyOption(rows, cards, option) for option in options]
+
+        dead = list(cards) + list(deadCards)
+        for r in [rows] + opponentRows:
+            dead += r[0] + r[1] + r[2]
+        deck = unseenCards(dead)
+
+        # Split the budget evenly between workers, each with its own random stream
+        chunks = max(self.workers, 1)
+        tasks = []
+        for i in range(0, chunks):
+            share = rollouts // chunks + (1 if i < rollouts % chunks else 0)
+            tasks.append((optionRows, opponentRows, deck, share, deadline, random.getrandbits(32)))
+
+        if self.pool != None:
+            results = self.pool.map(runRollouts, tasks)
+        else:
+            results = [runRollouts(task) for task in tasks]
+
+        played = sum([result[0] for result in results])
+        if played == 0:
+            raise ValueError("Time limit expired before any rollouts were played!")
+        opponentCount = max(len(opponentRows), 1)
+
+        evaluations = []
+        for index, option in enumerate(options):
+            points, fouls, royalties, rowWins = [sum([result[1][index][k] for result in results]) for k in range(0, 4)]
+            evaluations.append({'option': option,
+                                'placement': describeOption(cards, option),
+                                'ev': float(points) / played,
+                                'foulRate': float(fouls) / played,
+                                'royalties': float(royalties) / played,
+                                'rowWins': float(rowWins) / (played * opponentCount),
+                                'rollouts': played})
+
+        evaluations.sort(key=lambda e: e['ev'], reverse=True)
+        return evaluations
+
+    def bestPlacement(self, placement, cards, deadCards=[], opponentPlacements=[], rollouts=None, timeLimit=None):
+        """
+        Convenience wrapper around evaluate returning only the best option
+        :return: Dict for the placement with the highest expected value (see evaluate)
+        """
+        return self.evaluate(placement, cards, deadCards, opponentPlacements, rollouts, timeLimit)[0]
+
+
+if __name__ == "__main__":
+    # Testing functionality - evaluate the first 5 cards of a 2 player game
+    from game import Game
+    g = Game(playerCount=2)
+    playerNumber, roundActionNumber, cards = g.handleNextAction()
+    engine = PlacementEngine(rollouts=4000, timeLimit=0.8)
+    start = time.time()
+    evaluations = engine.evaluate(g.board.placements[playerNumber - 1], cards,
+                                  opponentPlacements=[g.board.placements[1]])
+    print "Evaluated %i options with %i rollouts in %.3fs" % \
+          (len(evaluations), evaluations[0]['rollouts'], time.time() - start)
+    for e in evaluations[:3]:
+        print "%s: ev %.2f, foul rate %.2f" % ([(c.card, row) for c, row in e['placement']], e['ev'], e['foulRate'])
+    engine.close()
@@ -4,7 +4,7 @@ from card import Card
 
 
 class Player(object):
-    def __init__(self, playerNumber=1, score=0, cards=[]):
+    def __init__(self, playerNumber=1, score=0, cards=None):
         """
         Initialise player object
         Each player has a player number, a score and a Placement object with a top, middle and bottom row
@@ -13,11 +13,14 @@ class Player(object):
         assert isinstance(playerNumber, int)
         assert 1 <= playerNumber <= 4
         assert isinstance(score, int)
+        cards = list(cards) if cards != None else []
         for c in cards:
             assert isinstance(c, Card)
 
         self.playerNumber = playerNumber
         self.score = score
         self.scoresList = None # This is used to store information about a player's row scores on the current round
-                               # List [Bool fouled, tuple bottom row score, tuple middle row score, tuple top row score]
+                               # List [Bool fouled, bottom row, middle row, top row] where each row is
+                               # List [pokerHand, int strength, classification]
+        self.royalties = 0     # Total royalties for the player's rows on the current round, set when scored
         self.cards = cards     # Holds card objects player has been dealt so far this round
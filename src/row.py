@@ -3,6 +3,7 @@ __author__ = 'Alastair Kerr'
 import eval, eval3c
 from deck import Deck
 from card import Card
+from rowSummary import RowSummary
 
 
 class Row(object):
@@ -24,17 +25,39 @@ class Row(object):
         self.playerNumber = playerNumber
         self.pokerHand = ""
 
-        self.cardPlacements = []
         # Use any supplied card placements or default to None value indicating empty slot
-        for i in range(0, self.size):
-            try:
-                self.cardPlacements.append(cardPlacements[i])
-            except:
-                self.cardPlacements.append(None)
+        self.cardPlacements = cardPlacements
+
+    @property
+    def cardPlacements(self):
+        """
+        List of Card objects (None for an empty slot)
+        Change placements with setPlacement or by assigning a new list, so the row summary stays in step
+        :return: List of Card objects
+        """
+        return self._cardPlacements
+
+    @cardPlacements.setter
+    def cardPlacements(self, cards):
+        """
+        Replace all of this row's placements, padding any missing slots with None
+        Rebuilds the row summary and invalidates any cached evaluation
+        :param cards: List of Card objects
+        :return: None
+        """
+        assert len(cards) <= self.size
+        self._cardPlacements = list(cards) + [None] * (self.size - len(cards))
+        self.invalidateCache()
+
+        self.summary = RowSummary(size=self.size)
+        for c in self._cardPlacements:
+            if c != None:
+                self.summary.addCard(c)
 
     def setPlacement(self, c=Card(), position=1, force=False):
         """
         Set a given position's card placement as the given card object
+        Updates the row summary and invalidates any cached evaluation
         :param c: Card object
         :param position: Int position (1 <= position <= row size)
         :return: None
@@ -43,53 +66,86 @@ class Row(object):
         assert isinstance(position, int)
         assert 1 <= position <= self.size
 
-        if (self.cardPlacements[position -1] == None or force):
-            self.cardPlacements[position -1] = c
+        existing = self._cardPlacements[position -1]
+        if (existing == None or force):
+            if (existing != None):
+                self.summary.removeCard(existing)
+            self._cardPlacements[position -1] = c
+            self.summary.addCard(c)
+            self.invalidateCache()
         else:
             raise ValueError("Tried to place a card where one already exists!")
 
+    def invalidateCache(self):
+        """
+        Clear the cached poker hand, score, strength and classification after a placement changes
+        Also flags the row as dirty, so the next compiled game state re-serialises it
+        :return: None
+        """
+        self.dirty = True
+        self.pokerHand = ""
+        self._score = None
+        self._strength = None
+        self._classification = None
+
     def getPokerHand(self):
         """
         Generates 10 char string containing details of poker hand in this row, stores as pokerHand
+        The string is only a view for display - scoring works directly on the card ids
         :return: 10 char poker hand string
         """
-        self.pokerHand = ""
-        for c in self.cardPlacements:
-            assert c != None
-            self.pokerHand += c.card
+        if (self.pokerHand == ""):
+            for c in self._cardPlacements:
+                assert c != None
+            self.pokerHand = "".join([c.card for c in self._cardPlacements])
         return self.pokerHand
 
     def scoreRow(self):
         """
-        Get poker hand string and use hand evaluator to score it
+        Use hand evaluator to score the card ids in this row, cached until the placements change
         :return: Poker hand score
         """
-        self.getPokerHand()
-        if (self.size == 3):
-            return eval3c.score_3(self.pokerHand)
-        elif (self.size == 5):
-            return eval.score_5(self.pokerHand)
+        if (self._score == None):
+            assert None not in self._cardPlacements
+            if (self.size == 3):
+                self._score = eval3c.score_3_cards(self._cardPlacements)
+            elif (self.size == 5):
+                self._score = eval.score_5_cards(self._cardPlacements)
+        return self._score
+
+    def strengthRow(self):
+        """
+        Use hand evaluator to get the int strength of the card ids in this row, cached until the placements change
+        3 and 5 card rows share one scale, so any two rows' strengths can be compared directly
+        :return: int strength
+        """
+        if (self._strength == None):
+            assert None not in self._cardPlacements
+            if (self.size == 3):
+                self._strength = eval3c.strength_3_cards(self._cardPlacements)
+            elif (self.size == 5):
+                self._strength = eval.strength_5_cards(self._cardPlacements)
+        return self._strength
 
     def classifyRow(self):
         """
-        Get poker hand string and return human readable classification
+        Return human readable classification of this row's poker hand, cached until the placements change
         :return: Poker hand class
         """
-        self.getPokerHand()
-        if (self.size == 3):
-            return eval3c.classify_3(self.pokerHand)
-        elif (self.size == 5):
-            return eval.classify_5(self.pokerHand)
+        if (self._classification == None):
+            if (self.size == 3):
+                self._classification = eval3c.classify_3(self.strengthRow())
+            elif (self.size == 5):
+                self._classification = eval.classify_5(self.strengthRow())
+        return self._classification
 
     def scoreAndClassify(self):
         """
         Function to score and classify this row's poker hand
-        :return: List [pokerHand, score, classification]
+        Served from the row's cache, so rescoring an unchanged row costs nothing
+        :return: List [pokerHand, int strength, classification] (a new list each call, callers may modify it)
         """
-        self.getPokerHand()
-        score = self.scoreRow()
-        classification = self.classifyRow()
-        return [self.pokerHand, score, classification]
+        return [self.getPokerHand(), self.strengthRow(), self.classifyRow()]
 
     def humanReadable(self):
         """
@@ -0,0 +1,180 @@
+__author__ = 'Alastair Kerr'
+
+# Category codes as used by the evaluators (score tuple index 0)
+HIGH_CARD, PAIR, TWO_PAIR, TRIPS, STRAIGHT, FLUSH, FULL_HOUSE, QUADS, STRAIGHT_FLUSH = range(1, 10)
+
+# Straight windows 2-6 up to T-A as rank index bitmasks (the evaluators do not count A-5 as a straight)
+STRAIGHT_WINDOWS = tuple([0x1F << low for low in range(0, 9)])
+ALL_STRAIGHT_WINDOWS = (1 << len(STRAIGHT_WINDOWS)) - 1
+
+# Bitmask of windows still reachable for each possible set of (unpaired) ranks already in a row
+WINDOWS_FOR_RANK_MASK = tuple([sum([1 << w for w in range(0, 9) if rankMask & ~STRAIGHT_WINDOWS[w] == 0])
+                               for rankMask in range(0, 1 << 13)])
+
+
+class RowSummary(object):
+    def __init__(self, size=5):
+        """
+        Running summary of the cards placed in a row, updated in O(1) as cards are added or removed
+        Lets search and pruning code ask what a partial row can still make without rescanning it
+        :param size: Row size (3 or 5)
+        :return: None
+        """
+        assert size in [3, 5]
+
+        self.size = size
+        self.cardCount = 0
+        self.rankCounts = [0] * 13          # Cards held of each rank index (2 -> 0, A -> 12)
+        self.suitCounts = [0] * 4           # Cards held of each suit index (H, D, S, C)
+        self.countOfCounts = [13, 0, 0, 0, 0]  # Number of ranks held 0, 1, 2, 3 and 4 times
+        self.rankMask = 0                   # Bit r set when rank index r is held
+        self.straightWindows = ALL_STRAIGHT_WINDOWS if size == 5 else 0
+
+    def addCard(self, card):
+        """
+        Update summary for a card placed in the row
+        :param card: Card object or card id
+        :return: None
+        """
+        rank = card >> 2
+        count = self.rankCounts[rank]
+        self.rankCounts[rank] = count + 1
+        self.countOfCounts[count] -= 1
+        self.countOfCounts[count + 1] += 1
+        self.suitCounts[card & 3] += 1
+        self.rankMask |= 1 << rank
+        self.cardCount += 1
+        self.updateStraightWindows()
+
+    def removeCard(self, card):
+        """
+        Update summary for a card taken out of the row (e.g. overwritten by a forced placement)
+        :param card: Card object or card id
+        :return: None
+        """
+        rank = card >> 2
+        count = self.rankCounts[rank]
+        assert count > 0
+        self.rankCounts[rank] = count - 1
+        self.countOfCounts[count] -= 1
+        self.countOfCounts[count - 1] += 1
+        self.suitCounts[card & 3] -= 1
+        if count == 1:
+            self.rankMask &= ~(1 << rank)
+        self.cardCount -= 1
+        self.updateStraightWindows()
+
+    def updateStraightWindows(self):
+        """
+        Recalculate the straight windows still reachable - none once the row holds a paired rank
+        :return: None
+        """
+        if self.size != 5 or self.countOfCounts[1] != self.cardCount:
+            self.straightWindows = 0
+        else:
+            self.straightWindows = WINDOWS_FOR_RANK_MASK[self.rankMask]
+
+    def openSlots(self):
+        """
+        :return: int number of empty positions left in the row
+        """
+        return self.size - self.cardCount
+
+    def maxRankCount(self):
+        """
+        :return: int most cards held of any one rank
+        """
+        for count in (4, 3, 2, 1):
+            if self.countOfCounts[count]:
+                return count
+        return 0
+
+    def canMakeFlush(self):
+        """
+        :return: True if every card placed so far shares a suit and the row is a 5 card row
+        """
+        return self.size == 5 and max(self.suitCounts) == self.cardCount
+
+    def canMakeStraight(self):
+        """
+        :return: True if at least one straight window is still reachable
+        """
+        return self.straightWindows != 0
+
+    def canMakeStraightFlush(self):
+        """
+        :return: True if the row can still make both a straight and a flush
+        """
+        return self.straightWindows != 0 and self.canMakeFlush()
+
+    def canMakeTrips(self):
+        """
+        :return: True if the row can still make three (or four) of a kind
+        """
+        return self.maxRankCount() + self.openSlots() >= 3
+
+    def canMakePair(self):
+        """
+        :return: True if the row can still make at least a pair
+        """
+        return self.maxRankCount() + self.openSlots() >= 2
+
+    def guaranteedCategory(self):
+        """
+        Category the row already holds, whatever fills the open slots
+        :return: int category code (1 high card - 9 straight flush)
+        """
+        counts = self.countOfCounts
+        if counts[4]:
+            return QUADS
+        if counts[3]:
+            return FULL_HOUSE if counts[2] else TRIPS
+        if counts[2] >= 2:
+            return TWO_PAIR
+        if counts[2]:
+            return PAIR
+
+        if self.size == 5 and self.cardCount == 5:
+            flush = self.canMakeFlush()
+            if flush and self.straightWindows:
+                return STRAIGHT_FLUSH
+            if flush:
+                return FLUSH
+            if self.straightWindows:
+                return STRAIGHT
+        return HIGH_CARD
+
+    def bestPossibleCategory(self):
+        """
+        Best category the row could still reach if the open slots were filled with ideal cards
+        Ignores which cards remain in the deck
+        :return: int category code (1 high card - 9 straight flush)
+        """
+        slots = self.openSlots()
+        maxCount = self.maxRankCount()
+
+        if self.size == 5:
+            if self.canMakeStraightFlush():
+                return STRAIGHT_FLUSH
+            if maxCount + slots >= 4:
+                return QUADS
+            if self.countOfCounts[1] + self.countOfCounts[2] + self.countOfCounts[3] <= 2:
+                return FULL_HOUSE
+            if self.canMakeFlush():
+                return FLUSH
+            if self.straightWindows:
+                return STRAIGHT
+
+        if maxCount + slots >= 3:
+            return TRIPS
+
+        if self.size == 5:
+            # Pair up singles first (1 card each), then any remaining slots make fresh pairs (2 cards each)
+            pairs = self.countOfCounts[2]
+            paired = min(self.countOfCounts[1], slots)
+            if pairs + paired + (slots - paired) // 2 >= 2:
+                return TWO_PAIR
+
+        if maxCount + slots >= 2:
+            return PAIR
+        return HIGH_CARD
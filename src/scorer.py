@@ -2,8 +2,166 @@ __author__ = 'Alastair Kerr'
 
 import itertools
 
+try:
+    import numpy
+except ImportError:
+    numpy = None  # Only needed for the batch scorer
+
 from player import Player
 from board import Board
+import eval, eval3c
+
+
+# Royalties by category code (score tuple index 0) for the 5 card rows, royal flushes score separately
+BOTTOM_CATEGORY_ROYALTIES = {5: 2, 6: 4, 7: 6, 8: 10, 9: 15}
+MIDDLE_CATEGORY_ROYALTIES = {4: 2, 5: 4, 6: 8, 7: 12, 8: 20, 9: 30}
+ROYAL_FLUSH_ROYALTIES = {'Bottom': 25, 'Middle': 50}
+# Top row royalties by rank value: pair of 6s = 1 up to pair of As = 9, trip 2s = 10 up to trip As = 22
+TOP_PAIR_ROYALTIES = dict([(rank, rank - 5) for rank in range(6, 15)])
+TOP_TRIPS_ROYALTIES = dict([(rank, rank + 8) for rank in range(2, 15)])
+
+# Royalties only depend on a row's category and first rank, i.e. the top 8 bits of its int strength
+ROYALTY_INDEX_SHIFT = 8
+ROYALTY_TABLE_SIZE = 10 << 4
+
+
+def buildRoyaltyTable(rowName):
+    """
+    Builds a flat royalty table for a row, indexed by row strength >> ROYALTY_INDEX_SHIFT
+    :param rowName: Bottom, Middle or Top
+    :return: List of int royalties
+    """
+    assert rowName in ['Bottom', 'Middle', 'Top']
+
+    table = [0] * ROYALTY_TABLE_SIZE
+    for category in range(1, 10):
+        for rank in range(2, 15):
+            index = (category << 4) | rank
+            if (rowName == 'Top'):
+                if (category == 2):
+                    table[index] = TOP_PAIR_ROYALTIES.get(rank, 0)
+                elif (category == 4):
+                    table[index] = TOP_TRIPS_ROYALTIES[rank]
+            else:
+                categoryRoyalties = BOTTOM_CATEGORY_ROYALTIES if rowName == 'Bottom' else MIDDLE_CATEGORY_ROYALTIES
+                table[index] = categoryRoyalties.get(category, 0)
+                if (category == 9 and rank == 14):
+                    table[index] = ROYAL_FLUSH_ROYALTIES[rowName]
+    return table
+
+ROYALTY_TABLES = {'Bottom': buildRoyaltyTable('Bottom'),
+                  'Middle': buildRoyaltyTable('Middle'),
+                  'Top': buildRoyaltyTable('Top')}
+# ROYALTY_TABLES as one (3, ROYALTY_TABLE_SIZE) numpy array in bottom, middle, top order, built on first use by scoreBatch
+BATCH_ROYALTY_TABLE = None
+
+
+def evaluateRows(bottom, middle, top):
+    """
+    Fast path scoring of one finished placement straight from card ids, with the same rules as
+    Scorer.scorePlayer, nullifyPlayerScores and calculatePlayerRoyalties - used by simulations and solvers
+    :param bottom: 5 card ids
+    :param middle: 5 card ids
+    :param top: 3 card ids
+    :return: (Bool fouled, (bottom, middle, top) int strengths, int royalties) - all 0 if fouled
+    """
+    b = eval.strength_5_cards(bottom)
+    m = eval.strength_5_cards(middle)
+    t = eval3c.strength_3_cards(top)
+    if not (b >= m >= t):
+        return (True, (0, 0, 0), 0)
+
+    shift = ROYALTY_INDEX_SHIFT
+    royalties = ROYALTY_TABLES['Bottom'][b >> shift] + ROYALTY_TABLES['Middle'][m >> shift] + \
+                ROYALTY_TABLES['Top'][t >> shift]
+    return (False, (b, m, t), royalties)
+
+def pairPoints(result1, result2):
+    """
+    Points player 1 wins from player 2 (row wins, scoops and royalties) - same rules as Scorer.evalPlayersScores
+    :param result1: evaluateRows output for player 1
+    :param result2: evaluateRows output for player 2
+    :return: int points (can be negative)
+    """
+    strengths1 = result1[1]
+    strengths2 = result2[1]
+    wins = 0
+    losses = 0
+    for i in (0, 1, 2):
+        if (strengths1[i] > strengths2[i]):
+            wins += 1
+        elif (strengths1[i] < strengths2[i]):
+            losses += 1
+
+    points = wins - losses + result1[2] - result2[2]
+    if (wins == 3):
+        points += 3
+    elif (losses == 3):
+        points -= 3
+    return points
+
+def netPoints(results):
+    """
+    Net points for every player in a finished round, matching the score changes made by Scorer.scoreAll
+    :param results: List of evaluateRows outputs, one per player in seat order
+    :return: List of int points per player
+    """
+    points = [0] * len(results)
+    for i, j in itertools.combinations(range(0, len(results)), 2):
+        p = pairPoints(results[i], results[j])
+        points[i] += p
+        points[j] -= p
+    return points
+
+
+def scoreBatch(strengths, fouled=None, playerCounts=None):
+    """
+    Vectorised scoring of many finished boards at once (requires numpy), with the same rules as Scorer.scoreAll
+    Each pair of seats is compared across the whole batch with array operations - at most 6 pairs for 4 players
+    :param strengths: (B, P, 3) int array-like of [bottom, middle, top] row strengths per board and seat
+    :param fouled: Optional (B, P) bool array-like of fouls flagged elsewhere - rows out of order always foul
+    :param playerCounts: Optional (B,) int array-like of players per board, for batches mixing 2-4 players
+                         (seats past a board's count are ignored and score 0)
+    :return: (points, royalties) int arrays of shape (B, P) - net points per seat and royalties (0 if fouled)
+    """
+    global BATCH_ROYALTY_TABLE
+    if numpy is None:
+        raise ImportError("scoreBatch requires numpy")
+    if BATCH_ROYALTY_TABLE is None:
+        BATCH_ROYALTY_TABLE = numpy.array([ROYALTY_TABLES[rowName] for rowName in ['Bottom', 'Middle', 'Top']],
+                                          dtype=numpy.int32)
+
+    strengths = numpy.array(strengths, dtype=numpy.int32)
+    assert strengths.ndim == 3 and strengths.shape[2] == 3
+    boards, seats = strengths.shape[0], strengths.shape[1]
+    assert 2 <= seats <= 4
+
+    foul = (strengths[:, :, 0] < strengths[:, :, 1]) | (strengths[:, :, 1] < strengths[:, :, 2])
+    if fouled is not None:
+        foul |= numpy.asarray(fouled, dtype=bool)
+    strengths[foul] = 0
+
+    index = strengths >> ROYALTY_INDEX_SHIFT
+    royalties = BATCH_ROYALTY_TABLE[0][index[:, :, 0]] + BATCH_ROYALTY_TABLE[1][index[:, :, 1]] + \
+                BATCH_ROYALTY_TABLE[2][index[:, :, 2]]
+
+    active = None
+    if playerCounts is not None:
+        active = numpy.arange(seats) < numpy.asarray(playerCounts).reshape(-1, 1)
+
+    points = numpy.zeros((boards, seats), dtype=numpy.int32)
+    for i, j in itertools.combinations(range(0, seats), 2):
+        wins = (strengths[:, i] > strengths[:, j]).sum(axis=1)
+        losses = (strengths[:, i] < strengths[:, j]).sum(axis=1)
+        p = wins - losses + royalties[:, i] - royalties[:, j] + 3 * (wins == 3) - 3 * (losses == 3)
+        if active is not None:
+            p *= active[:, i] & active[:, j]
+        points[:, i] += p
+        points[:, j] -= p
+
+    if active is not None:
+        royalties *= active
+    return points, royalties
 
 
 class Scorer(object):
@@ -32,6 +190,7 @@ class Scorer(object):
             p.scoresList = self.scorePlayer(p)
             if (p.scoresList[0] == True):
                 self.nullifyPlayerScores(p)
+            p.royalties = self.calculatePlayerRoyalties(p)
 
         # Work out all scoring combinations - each player's score is compared against each other player's score
         combinations = itertools.combinations(self.players, 2)
@@ -43,8 +202,9 @@ class Scorer(object):
     def scorePlayer(self, player):
         """
         Score the given player's rows, and check if they fouled
+        Row strengths share one int scale for 3 and 5 card rows, so the foul check is two int comparisons
         :param player: Player object
-        :return: List [Bool fouled, tuple bottom row score, tuple middle row score, tuple top row score]
+        :return: List [Bool fouled, bottom row, middle row, top row], each row [pokerHand, int strength, classification]
         """
         assert isinstance(player, Player)
 
@@ -69,7 +229,7 @@ class Scorer(object):
         """
         assert isinstance(player, Player)
         for i in range(1,4):
-            player.scoresList[i][1] = (0, 0)
+            player.scoresList[i][1] = 0
 
     def evalPlayersScores(self, player1, player2):
         """
@@ -108,33 +268,19 @@ class Scorer(object):
         assert isinstance(player1, Player)
         assert isinstance(player2, Player)
 
-        p1original = player1.score
-
-        # Bottom row
-        if (player1.scoresList[1][1] > player2.scoresList[1][1]):
-            player1.score += 1
-            player2.score -= 1
-        elif (player1.scoresList[1][1] < player2.scoresList[1][1]):
-            player1.score -=1
-            player2.score += 1
-
-        # Middle row
-        if (player1.scoresList[2][1] > player2.scoresList[2][1]):
-            player1.score += 1
-            player2.score -= 1
-        elif (player1.scoresList[2][1] < player2.scoresList[2][1]):
-            player1.score -= 1
-            player2.score += 1
-
-        # Top row
-        if (player1.scoresList[3][1] > player2.scoresList[2][1]):
-            player1.score += 1
-            player2.score -= 1
-        elif (player1.scoresList[3][1] < player2.scoresList[3][1]):
-            player1.score -= 1
-            player2.score += 1
-
-        return player1.score - p1original
+        p1won = 0
+        # Bottom, middle and top rows - compare int strengths of the same row for each player
+        for i in range(1, 4):
+            p1strength = player1.scoresList[i][1]
+            p2strength = player2.scoresList[i][1]
+            if (p1strength > p2strength):
+                p1won += 1
+            elif (p1strength < p2strength):
+                p1won -= 1
+
+        player1.score += p1won
+        player2.score -= p1won
+        return p1won
 
     def handleScoops(self, player1, player2):
         """
@@ -146,17 +292,16 @@ class Scorer(object):
         assert isinstance(player1, Player)
         assert isinstance(player2, Player)
 
+        p1 = player1.scoresList
+        p2 = player2.scoresList
+
         scoopMessage = ""
-        if ( player1.scoresList[1][1] > player2.scoresList[1][1] and \
-             player1.scoresList[2][1] > player2.scoresList[2][1] and \
-             player1.scoresList[3][1] > player2.scoresList[3][1] ):
+        if ( p1[1][1] > p2[1][1] and p1[2][1] > p2[2][1] and p1[3][1] > p2[3][1] ):
             player1.score += 3
             player2.score -= 3
             scoopMessage = " and scooped for +3 points!"
 
-        elif ( player2.scoresList[1][1] > player1.scoresList[1][1] and \
-               player2.scoresList[2][1] > player1.scoresList[2][1] and \
-               player2.scoresList[3][1] > player1.scoresList[3][1] ):
+        elif ( p2[1][1] > p1[1][1] and p2[2][1] > p1[2][1] and p2[3][1] > p1[3][1] ):
             player1.score -= 3
             player2.score += 3
             scoopMessage = " and scooped for +3 points!"
@@ -165,7 +310,7 @@ class Scorer(object):
 
     def compareRoyalties(self, player1, player2):
         """
-        Work out royalties for each given player, make the appropriate score changes and return this result
+        Make the score changes for each given player's royalties (worked out once per round in scoreAll) and return this result
         :param player1: Player object
         :param player2: Player object
         :return: int points player 1 won from player 2 (can be negative)
@@ -173,61 +318,35 @@ class Scorer(object):
         assert isinstance(player1, Player)
         assert isinstance(player2, Player)
 
-        player1gains = 0
-        player1gains += self.calculateRoyalties(player1.scoresList[1][1], 'Bottom')
-        player1gains += self.calculateRoyalties(player1.scoresList[2][1], 'Middle')
-        player1gains += self.calculateRoyalties(player1.scoresList[3][1], 'Top')
-        player1gains -= self.calculateRoyalties(player2.scoresList[1][1], 'Bottom')
-        player1gains -= self.calculateRoyalties(player2.scoresList[2][1], 'Middle')
-        player1gains -= self.calculateRoyalties(player2.scoresList[3][1], 'Top')
+        player1gains = player1.royalties - player2.royalties
 
         player1.score += player1gains
         player2.score -= player1gains
 
         return player1gains
 
-    def calculateRoyalties(self, score, rowName):
+    def calculatePlayerRoyalties(self, player):
+        """
+        Total royalties for the given player's rows this round (0 if they fouled, as their strengths are nullified)
+        :param player: Player object with scoresList set
+        :return: int points
+        """
+        assert isinstance(player, Player)
+
+        shift = ROYALTY_INDEX_SHIFT
+        return ROYALTY_TABLES['Bottom'][player.scoresList[1][1] >> shift] + \
+               ROYALTY_TABLES['Middle'][player.scoresList[2][1] >> shift] + \
+               ROYALTY_TABLES['Top'][player.scoresList[3][1] >> shift]
+
+    def calculateRoyalties(self, strength, rowName):
         """
-        Takes row score tuple and calculates royalties based on row type
-        :param score: Score tuple from row eval
+        Takes row int strength and looks up royalties based on row type
+        :param strength: int strength from row eval
         :param rowName: Bottom, Middle or Top
         :return: int points
         """
-        assert isinstance(score, tuple)
+        assert isinstance(strength, (int, long))
         assert isinstance(rowName, basestring)
         assert rowName in ['Bottom', 'Middle', 'Top']
 
-        if (score[0] == 0):
-            return 0
-
-        if (rowName == 'Bottom'):
-            royaltyMappings = {5: 2, 6: 4, 7: 6, 8: 10, 9: 15}
-            # Special case for royal flush
-            if (score[0] == 9 and score[1] == 14):
-                return 25
-            try:
-                royalty = royaltyMappings[score[0]]
-                return royalty
-            except:
-                return 0
-
-        elif (rowName == 'Middle'):
-            royaltyMappings = {4: 2, 5: 4, 6: 8, 7: 12, 8: 20, 9: 30}
-            # Special case for royal flush
-            if (score[0] == 9 and score[1] == 14):
-                return 50
-            try:
-                royalty = royaltyMappings[score[0]]
-                return royalty
-            except:
-                return 0
-
-        elif (rowName == 'Top'):
-            # Top row gets specific royalties for pair of 6s or higher
-            if (score[0] == 2):
-                if (score[1] < 6):
-                    return 0
-                return -5 + score[1]
-            elif (score[1] == 3):
-                return 8 + score[1]
-            return 0
+        return ROYALTY_TABLES[rowName][strength >> ROYALTY_INDEX_SHIFT]
@@ -7,8 +7,11 @@ from jinja2 import Environment, FileSystemLoader
 
 import config
 import tools
-from gameHandler import GameHandler
+from gameHandler import GameHandler, ACTIONS
 from database_handler import Database
+from storage_backends import MemoryBackend
+from gameStateCache import GameStateCache
+from gameEventLog import GameEventLog
 
 env = Environment(loader=FileSystemLoader('templates'))
 
@@ -21,17 +24,35 @@ class Api(object):
     def __init__(self):
         """
         Initialise required objects
+        Game states are stored as an event log and/or served through an in-process cache when enabled in config
+        (the cache is flushed when the engine stops)
+        Refuses to start on a database that needs migrating (see migrate_database.py), or with the event log on the
+        memory storage backend, which can't run its SQL
         """
-        self.db = Database()
+        self.database = Database()
+        self.database.check_schema()
+        if config.event_log_config['ENABLED'] and isinstance(self.database.backend, MemoryBackend):
+            raise ValueError("The game event log needs an SQL storage backend, not 'memory'")
+        self.db = self.database
+        # Runs after the cache flush below (lower priorities run first)
+        cherrypy.engine.subscribe('stop', self.database.close, priority=60)
+        if config.event_log_config['ENABLED']:
+            self.db = GameEventLog(self.db, snapshot_interval=config.event_log_config['SNAPSHOT_INTERVAL'])
+        cache_config = config.game_state_cache_config
+        if cache_config['ENABLED']:
+            self.db = GameStateCache(self.db, max_entries=cache_config['MAX_ENTRIES'], ttl=cache_config['TTL'],
+                                     write_behind=cache_config['WRITE_BEHIND'],
+                                     flush_interval=cache_config['FLUSH_INTERVAL'])
+            cherrypy.engine.subscribe('stop', self.db.close)
 
     def updateDatabase(self, game_state, game_id):
         """
         Updates database entry for given game id (or creates new entry if none exists)
-        :param game_state: Game state to update entry with
+        :param game_state: Game state dict to update entry with (stored in the configured encoding)
         :param game_id: uuid4 for game
         :return: None
         """
-        db_result = self.db.update_game_state(str(game_id), str(game_state))
+        db_result = self.db.update_game_state(str(game_id), game_state)
         if db_result:
             tools.write_error(db_result)
             raise cherrypy.HTTPError(500, "Database error! See error logs for dump.")
@@ -103,7 +124,9 @@ class Api(object):
             tools.write_error("ofc_backend failed to interpret request: %s" % params)
             raise cherrypy.HTTPError(500, "Invalid request! See error logs for dump.")
 
-        gameHandler = GameHandler(variant=game_state['variant'], playerCount=game_state['playerCount'], gameState=game_state)
+        action = payload['action'] if payload['action'] in ACTIONS else None
+        gameHandler = GameHandler(variant=game_state['variant'], playerCount=game_state['playerCount'], gameState=game_state,
+                                  action=action)
 
         if payload['action'] == 'nextAction':
             response = gameHandler.getNextActionDetails()
@@ -122,9 +145,24 @@ class Api(object):
         self.updateDatabase(gameHandler.getCompiledGameState(), game_id)
         return response
 
+    @cherrypy.tools.json_out()
+    def stats(self):
+        """
+        Storage metrics for load testing - connection pool wait times and use, plus group commit batch sizes and
+        cache hit rates if enabled
+        :return: Dict
+        """
+        stats = {'pool': self.database.pool_stats()}
+        if self.database.batch_writer != None:
+            stats['batches'] = self.database.batch_writer.stats()
+        if isinstance(self.db, GameStateCache):
+            stats['cache'] = self.db.stats()
+        return stats
+
     make_game.exposed = True
     render_game.exposed = True
     ofc_backend.exposed = True
+    stats.exposed = True
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+__author__ = 'Alastair Kerr'
+
+import argparse
+import multiprocessing
+import random
+import time
+
+from game import Game
+from deck import seededRandom, newSeed
+from placementEngine import PlacementEngine, rowsFromPlacement, legalPlacements, placeOption
+from lateStreetSolver import solveLateStreet
+import scorer
+
+
+class RandomPolicy(object):
+    """
+    Places each dealt card in a random free slot
+    """
+    def chooseOption(self, game, playerNumber, roundActionNumber, cards):
+        """
+        :param game: Game object mid round
+        :param playerNumber: int player to act
+        :param roundActionNumber: int round action the cards were dealt on
+        :param cards: List of Card objects just dealt
+        :return: Tuple of row indices, one per card (see placementEngine.legalPlacements)
+        """
+        placement = game.board.placements[playerNumber - 1]
+        return random.choice(legalPlacements(rowsFromPlacement(placement), cards))
+
+
+class MonteCarloPolicy(object):
+    def __init__(self, rollouts=200):
+        """
+        Picks the placement with the best Monte Carlo EV, running rollouts in this process
+        (simulations parallelise over games instead)
+        :param rollouts: Rollout budget per decision
+        :return: None
+        """
+        self.engine = PlacementEngine(workers=0, rollouts=rollouts, timeLimit=None)
+
+    def chooseOption(self, game, playerNumber, roundActionNumber, cards):
+        placement, opponents = self.boards(game, playerNumber)
+        return self.engine.bestPlacement(placement, cards, opponentPlacements=opponents)['option']
+
+    def boards(self, game, playerNumber):
+        """
+        :return: (acting player's Placement object, [opponent Placement objects])
+        """
+        placements = game.board.placements
+        return placements[playerNumber - 1], [p for p in placements if p.playerNumber != playerNumber]
+
+
+class SolverPolicy(MonteCarloPolicy):
+    """
+    Monte Carlo placements, switching to the exact late street solver for the last two cards
+    """
+    def chooseOption(self, game, playerNumber, roundActionNumber, cards):
+        if roundActionNumber < 8:
+            return MonteCarloPolicy.chooseOption(self, game, playerNumber, roundActionNumber, cards)
+        placement, opponents = self.boards(game, playerNumber)
+        return solveLateStreet(placement, cards, opponentPlacements=opponents)[0]['option']
+
+
+POLICIES = {'random': RandomPolicy,
+            'montecarlo': MonteCarloPolicy,
+            'solver': SolverPolicy}
+
+# Policy objects for this process, created on first use and reused for every game it plays
+POLICY_INSTANCES = {}
+
+
+def getPolicy(name, rollouts):
+    """
+    :param name: Key in POLICIES
+    :param rollouts: Rollout budget for Monte Carlo policies
+    :return: Policy object
+    """
+    key = (name, rollouts)
+    if key not in POLICY_INSTANCES:
+        if name == 'random':
+            POLICY_INSTANCES[key] = RandomPolicy()
+        else:
+            POLICY_INSTANCES[key] = POLICIES[name](rollouts=rollouts)
+    return POLICY_INSTANCES[key]
+
+def playGame(task):
+    """
+    Worker function: plays one full round and scores it with the scorer fast path (no score messages are built)
+    :param task: (int playerCount, [policy name per seat], int rollouts, int firstToAct, int seed)
+    :return: ([net points], [Bool fouled], [royalties]) per seat
+    """
+    playerCount, policyNames, rollouts, firstToAct, seed = task
+    # Cards come from the game's own seeded stream; policies draw from a separate stream of the same seed
+    random.seed(seededRandom(seed, 'policies').getrandbits(64))
+
+    game = Game(playerCount=playerCount, firstToAct=firstToAct, nextToAct=firstToAct, seed=seed)
+    policies = [getPolicy(name, rollouts) for name in policyNames]
+    for i in range(0, 9 * playerCount):
+        playerNumber, roundActionNumber, cards = game.handleNextAction()
+        option = policies[playerNumber - 1].chooseOption(game, playerNumber, roundActionNumber, cards)
+        placeOption(game.board.placements[playerNumber - 1], cards, option)
+
+    results = []
+    for placement in game.board.placements:
+        rows = rowsFromPlacement(placement)
+        results.append(scorer.evaluateRows(rows[0], rows[1], rows[2]))
+    return scorer.netPoints(results), [r[0] for r in results], [r[2] for r in results]
+
+
+class SimulationStats(object):
+    def __init__(self, playerCount):
+        """
+        Running per seat totals over simulated games
+        :param playerCount: int number of seats
+        :return: None
+        """
+        self.games = 0
+        self.points = [0] * playerCount
+        self.squaredPoints = [0] * playerCount
+        self.fouls = [0] * playerCount
+        self.royalties = [0] * playerCount
+
+    def add(self, result):
+        """
+        :param result: playGame output
+        :return: None
+        """
+        points, fouls, royalties = result
+        self.games += 1
+        for seat in range(0, len(points)):
+            self.points[seat] += points[seat]
+            self.squaredPoints[seat] += points[seat] ** 2
+            self.fouls[seat] += fouls[seat]
+            self.royalties[seat] += royalties[seat]
+
+    def summary(self):
+        """
+        :return: List of dicts per seat with keys 'meanPoints', 'stdDevPoints', 'foulRate' and 'meanRoyalties'
+        """
+        games = float(max(self.games, 1))
+        seats = []
+        for seat in range(0, len(self.points)):
+            mean = self.points[seat] / games
+            variance = max(self.squaredPoints[seat] / games - mean ** 2, 0)
+            seats.append({'meanPoints': mean,
+                          'stdDevPoints': variance ** 0.5,
+                          'foulRate': self.fouls[seat] / games,
+                          'meanRoyalties': self.royalties[seat] / games})
+        return seats
+
+
+def simulate(games=1000, playerCount=2, workers=None, policies=('random',), rollouts=200, seed=None):
+    """
+    Plays a batch of independent rounds on a process pool
+    The first player to act rotates between games so each seat sees every position
+    :param games: int number of rounds to play
+    :param playerCount: int players per game
+    :param workers: int worker processes (None for one per CPU, 0 to play in this process)
+    :param policies: Policy names (keys of POLICIES) assigned to seats in turn
+    :param rollouts: Rollout budget per decision for Monte Carlo policies
+    :param seed: Base seed - game i is played from seed + i, so a sweep (or any one game) can be repeated exactly
+    :return: (SimulationStats object, float elapsed seconds)
+    """
+    assert 2 <= playerCount <= 4
+    for name in policies:
+        if name not in POLICIES:
+            raise ValueError("Unknown policy '%s' (choose from %s)" % (name, ", ".join(sorted(POLICIES))))
+
+    seatPolicies = [policies[seat % len(policies)] for seat in range(0, playerCount)]
+    if seed == None:
+        seed = newSeed()
+    tasks = [(playerCount, seatPolicies, rollouts, 1 + i % playerCount, seed + i) for i in xrange(0, games)]
+
+    stats = SimulationStats(playerCount)
+    start = time.time()
+    workers = workers if workers != None else multiprocessing.cpu_count()
+    if workers > 0:
+        pool = multiprocessing.Pool(workers)
+        try:
+            chunksize = max(1, min(64, games // (workers * 8)))
+            for result in pool.imap_unordered(playGame, tasks, chunksize):
+                stats.add(result)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            stats.add(playGame(task))
+
+    return stats, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless batch simulation of OFC rounds")
+    parser.add_argument('--games', type=int, default=1000, help="number of rounds to play")
+    parser.add_argument('--players', type=int, default=2, choices=[2, 3, 4], help="players per game")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default one per CPU, 0 in-process)")
+    parser.add_argument('--policy', default='random',
+                        help="comma separated policies assigned to seats in turn (%s)" % ", ".join(sorted(POLICIES)))
+    parser.add_argument('--rollouts', type=int, default=200, help="rollouts per decision for Monte Carlo policies")
+    parser.add_argument('--seed', type=int, default=None, help="base seed for a reproducible sweep")
+    args = parser.parse_args()
+
+    policies = args.policy.split(',')
+    stats, elapsed = simulate(games=args.games, playerCount=args.players, workers=args.workers,
+                              policies=policies, rollouts=args.rollouts, seed=args.seed)
+
+    print "Played %i games in %.2fs (%.1f games/sec)" % (stats.games, elapsed, stats.games / max(elapsed, 1e-9))
+    for seat, s in enumerate(stats.summary()):
+        print "Player %i (%s): mean points %+.3f (sd %.2f), foul rate %.3f, mean royalties %.2f" % \
+              (seat + 1, policies[seat % len(policies)], s['meanPoints'], s['stdDevPoints'], s['foulRate'],
+               s['meanRoyalties'])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,686 @@
+__author__ = "Alastair Kerr"
+
+import collections
+import contextlib
+import sqlite3
+import threading
+import time
+
+try:
+    import MySQLdb
+except ImportError:
+    # Only needed for the MySQL backend
+    MySQLdb = None
+
+import config
+import tools
+
+# MySQL client error raised when the server closed the connection before the query was sent - safe to retry
+SERVER_GONE_ERROR = 2006
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Bounded, thread-safe pool of database connections
+    Idle connections are reused most recently used first, so spare ones age out and are closed after idle_timeout.
+    Connections idle for longer than ping_after are pinged before use and replaced if the ping fails
+    """
+    def __init__(self, connect, size=10, timeout=30, idle_timeout=300, ping_after=30, ping=None, broken_errors=()):
+        """
+        :param connect: Function returning a new connection
+        :param ping: Function raising an exception if a connection is dead (defaults to connection.ping())
+        :param broken_errors: Exception classes that mean a connection should be discarded rather than reused
+        :param size: Most connections open at once - callers wait for a free one beyond this
+        :param timeout: Most seconds to wait for a free connection (None to wait forever)
+        :param idle_timeout: Seconds an idle connection is kept open
+        :param ping_after: Seconds idle before a connection is health checked on acquire
+        """
+        assert size > 0
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.ping_function = ping if ping != None else lambda connection: connection.ping()
+        self.broken_errors = tuple(broken_errors)
+
+        self.condition = threading.Condition(threading.Lock())
+        self.idle = []      # [(connection, time released)], most recently released last
+        self.open = 0
+        self.in_use = 0
+
+        # Metrics
+        self.acquired = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.reconnects = 0
+        self.evicted = 0
+
+    def acquire(self):
+        """
+        Takes a healthy connection from the pool, opening one if there is room or waiting for one to be released
+        :return: Connection
+        """
+        start = time.time()
+        with self.condition:
+            while not self.idle and self.open >= self.size:
+                remaining = None if self.timeout == None else self.timeout - (time.time() - start)
+                if remaining != None and remaining <= 0:
+                    raise PoolTimeout("No free database connection after %.1fs (%i in use)" % (self.timeout, self.in_use))
+                self.condition.wait(remaining)
+
+            waited = time.time() - start
+            self.acquired += 1
+            if waited > 0.001:
+                self.waits += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+            stale = self.evict_idle()
+            connection, released = self.idle.pop() if self.idle else (None, None)
+            # Reserve the slot before connecting outside the lock
+            self.in_use += 1
+            if connection == None:
+                self.open += 1
+
+        for c in stale:
+            self.close_connection(c)
+
+        try:
+            if connection != None and time.time() - released > self.ping_after and not self.ping(connection):
+                self.close_connection(connection)
+                connection = None
+                with self.condition:
+                    self.reconnects += 1
+            if connection == None:
+                connection = self.connect()
+        except:
+            with self.condition:
+                self.in_use -= 1
+                self.open -= 1
+                self.condition.notify()
+            raise
+        return connection
+
+    def release(self, connection, broken=False):
+        """
+        Returns a connection to the pool
+        :param connection: Connection from acquire
+        :param broken: True if the connection failed and should be closed rather than reused
+        :return: None
+        """
+        with self.condition:
+            self.in_use -= 1
+            if broken:
+                self.open -= 1
+                self.reconnects += 1
+            else:
+                self.idle.append((connection, time.time()))
+            self.condition.notify()
+        if broken:
+            self.close_connection(connection)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Context manager for a pooled connection - the connection is discarded if the block raises a database error
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        except Exception, e:
+            self.release(connection, broken=isinstance(e, self.broken_errors))
+            raise
+        self.release(connection)
+
+    def evict_idle(self):
+        """
+        Removes connections idle for longer than idle_timeout - call with the lock held
+        :return: List of connections to close
+        """
+        cutoff = time.time() - self.idle_timeout
+        stale = [c for c, released in self.idle if released < cutoff]
+        if stale:
+            self.idle = [(c, released) for c, released in self.idle if released >= cutoff]
+            self.open -= len(stale)
+            self.evicted += len(stale)
+        return stale
+
+    def ping(self, connection):
+        """
+        :return: True if the connection is still alive
+        """
+        try:
+            self.ping_function(connection)
+            return True
+        except Exception:
+            return False
+
+    def close_connection(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Closes every idle connection - connections in use are closed when released broken or left to the server
+        :return: None
+        """
+        with self.condition:
+            idle = self.idle
+            self.idle = []
+            self.open -= len(idle)
+        for c, released in idle:
+            self.close_connection(c)
+
+    def stats(self):
+        """
+        Pool metrics - a high wait count or mean wait with in_use at size means the pool is the bottleneck
+        :return: Dict
+        """
+        with self.condition:
+            return {'size': self.size,
+                    'open': self.open,
+                    'in_use': self.in_use,
+                    'idle': len(self.idle),
+                    'acquired': self.acquired,
+                    'waits': self.waits,
+                    'mean_wait': self.total_wait / max(self.acquired, 1),
+                    'max_wait': self.max_wait,
+                    'reconnects': self.reconnects,
+                    'evicted': self.evicted}
+
+
+# Columns of the games table, in order
+GAME_COLUMNS = ('id', 'game_id', 'game_state', 'version', 'created_at', 'updated_at')
+
+
+class SQLBackend(object):
+    """
+    Game state storage on a pooled SQL connection - subclasses provide the connection and dialect
+    Every backend offers get, upsert and scan on the games table, plus execute_query for other SQL (the event log and
+    migrations use MySQL style %s placeholders, which SQL backends convert as needed)
+    """
+    # Upsert with the VALUES rows left as %s, so one statement can write several games
+    UPSERT = None
+
+    def __init__(self, pool):
+        """
+        :param pool: ConnectionPool object
+        """
+        self.pool = pool
+
+    def execute_query(self, query, params=None, rowcount=False):
+        """
+        Executes given query on a pooled connection
+        :param query: string SQL query, with %s placeholders for any params
+        :param params: Tuple of values for the placeholders, escaped by the driver
+        :param rowcount: True to return the number of rows changed instead of the rows fetched
+        :return: Result of query, or an error string on failure
+        """
+        try:
+            with self.pool.connection() as db:
+                cur = db.cursor()
+                try:
+                    cur.execute(query, params or ())
+                    return cur.rowcount if rowcount else cur.fetchall()
+                finally:
+                    cur.close()
+        except Exception, e:
+            error = "%s: %s" % (tools.get_formatted_datetime(), e)
+            tools.write_error("There was an error executing an SQL query!")
+            tools.write_error(error + "\n")
+            return error
+
+    def get(self, game_id):
+        """
+        :param game_id: str uuid4
+        :return: Stored game state, or None if there is no game with that id
+        """
+        result = self.execute_query("SELECT game_state FROM games WHERE game_id = %s", (game_id,))
+        if isinstance(result, basestring):
+            raise IOError(result)
+        return result[0][0] if result else None
+
+    def get_row(self, game_id):
+        """
+        :param game_id: str uuid4
+        :return: Tuple of the game's row values (see GAME_COLUMNS), or None if there is no game with that id
+        """
+        result = self.execute_query("SELECT %s FROM games WHERE game_id = %%s" % ", ".join(GAME_COLUMNS), (game_id,))
+        if isinstance(result, basestring):
+            raise IOError(result)
+        return tuple(result[0]) if result else None
+
+    def upsert(self, game_id, game_state):
+        """
+        Stores a game state, creating the game's row if needed and bumping its version otherwise
+        :param game_id: str uuid4
+        :param game_state: str serialised game state
+        :return: Result of query (error string on failure)
+        """
+        return self.upsert_many([(game_id, game_state)])
+
+    def upsert_many(self, rows):
+        """
+        Stores several game states in one multi-row statement, so they commit together as one transaction
+        :param rows: List of (game_id, str serialised game state) tuples, at most one per game
+        :return: Result of query (error string on failure)
+        """
+        params = []
+        for game_id, game_state in rows:
+            params.extend([game_id, game_state])
+        return self.execute_query(self.UPSERT % ", ".join(["(%s, %s)"] * len(rows)), tuple(params))
+
+    def scan(self, after_id=0, limit=500):
+        """
+        Reads stored games in id order, a page at a time
+        :param after_id: Row id to start after (the last id of the previous page)
+        :param limit: Most rows to return
+        :return: List of (row id, game_id, game state) tuples
+        """
+        result = self.execute_query("SELECT id, game_id, game_state FROM games WHERE id > %s ORDER BY id LIMIT %s",
+                                    (after_id, limit))
+        if isinstance(result, basestring):
+            raise IOError(result)
+        return list(result)
+
+    def check_schema(self):
+        """
+        Checks the games table supports the upsert - backends that create their own schema have nothing to check
+        :return: None
+        """
+        pass
+
+    def stats(self):
+        """
+        :return: Dict of connection pool metrics (see ConnectionPool.stats)
+        """
+        return self.pool.stats()
+
+    def close(self):
+        self.pool.close()
+
+
+class MySQLBackend(SQLBackend):
+    UPSERT = "INSERT INTO games (game_id, game_state) VALUES %s " \
+             "ON DUPLICATE KEY UPDATE game_state = VALUES(game_state), version = version + 1"
+
+    def __init__(self, pool_size):
+        """
+        MySQL storage using config.database_config, on autocommit connections
+        :param pool_size: Most open connections
+        """
+        if MySQLdb == None:
+            raise ImportError("The mysql storage backend needs MySQLdb installed")
+        self.HOST = config.database_config['HOST']
+        self.PORT = config.database_config['PORT']
+        self.USER = config.database_config['USER']
+        self.PASS = config.database_config['PASS']
+        self.DB = config.database_config['DB']
+
+        pool_config = config.database_pool_config
+        SQLBackend.__init__(self, ConnectionPool(self.connect, size=pool_size, timeout=pool_config['TIMEOUT'],
+                                                 idle_timeout=pool_config['IDLE_TIMEOUT'],
+                                                 ping_after=pool_config['PING_AFTER'],
+                                                 broken_errors=(MySQLdb.OperationalError,)))
+
+    def connect(self):
+        """
+        Opens a new autocommit connection to the database
+        :return: MySQLdb connection
+        """
+        db = MySQLdb.connect(host=self.HOST,
+                             port=self.PORT,
+                             user=self.USER,
+                             passwd=self.PASS,
+                             db=self.DB)
+        db.autocommit(True)
+        return db
+
+    def has_unique_game_id(self):
+        """
+        :return: True if games has a unique index on game_id
+        """
+        result = self.execute_query("SELECT index_name FROM information_schema.statistics WHERE "
+                                    "table_schema = DATABASE() AND table_name = 'games' AND column_name = 'game_id' "
+                                    "AND non_unique = 0")
+        if isinstance(result, basestring):
+            raise IOError(result)
+        return len(result) > 0
+
+    def check_schema(self):
+        """
+        The upsert relies on a unique index on game_id - without it every write inserts another row for the game
+        Raises RuntimeError for databases created before the index was added
+        :return: None
+        """
+        if not self.has_unique_game_id():
+            raise RuntimeError("The games table has no unique index on game_id - run migrate_database.py first")
+
+    def execute_query(self, query, params=None, rowcount=False):
+        """
+        Executes given query, replacing a connection the server has dropped and retrying once
+        """
+        for attempt in range(0, 2):
+            try:
+                with self.pool.connection() as db:
+                    cur = db.cursor()
+                    try:
+                        cur.execute(query, params)
+                        return cur.rowcount if rowcount else cur.fetchall()
+                    finally:
+                        cur.close()
+            except MySQLdb.OperationalError, e:
+                if attempt == 0 and e.args and e.args[0] == SERVER_GONE_ERROR:
+                    continue
+                error = "%s: %s" % (tools.get_formatted_datetime(), e)
+            except Exception, e:
+                error = "%s: %s" % (tools.get_formatted_datetime(), e)
+
+            tools.write_error("There was an error executing an SQL query!")
+            tools.write_error(error + "\n")
+            return error
+
+
+SQLITE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS games (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        game_id VARCHAR(40) NOT NULL UNIQUE,
+        game_state BLOB NOT NULL,
+        version INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)""",
+    """CREATE TABLE IF NOT EXISTS game_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        game_id VARCHAR(40) NOT NULL,
+        sequence INTEGER NOT NULL,
+        event_type VARCHAR(16) NOT NULL,
+        payload BLOB NOT NULL,
+        UNIQUE (game_id, sequence))""",
+    "CREATE INDEX IF NOT EXISTS game_snapshots ON game_events (game_id, event_type, sequence)",
+]
+
+
+class SQLiteBackend(SQLBackend):
+    UPSERT = "INSERT INTO games (game_id, game_state) VALUES %s ON CONFLICT (game_id) DO UPDATE SET " \
+             "game_state = excluded.game_state, version = version + 1, updated_at = CURRENT_TIMESTAMP"
+
+    def __init__(self, path, pool_size):
+        """
+        Local SQLite storage in WAL mode, so readers don't block the writer - no database server needed
+        The schema (games and game_events, as in the MySQL template) is created if missing
+        :param path: Database file, or ':memory:' for a throwaway database (held on a single connection)
+        :param pool_size: Most open connections
+        """
+        self.path = path
+        pool_config = config.database_pool_config
+        idle_timeout = pool_config['IDLE_TIMEOUT']
+        if path == ':memory:':
+            # The database only lives as long as its one connection
+            pool_size, idle_timeout = 1, float('inf')
+        SQLBackend.__init__(self, ConnectionPool(self.connect, size=pool_size, timeout=pool_config['TIMEOUT'],
+                                                 idle_timeout=idle_timeout,
+                                                 ping_after=pool_config['PING_AFTER'],
+                                                 ping=lambda db: db.execute("SELECT 1"),
+                                                 broken_errors=(sqlite3.OperationalError,)))
+        for statement in SQLITE_SCHEMA:
+            result = self.execute_query(statement)
+            if isinstance(result, basestring):
+                raise IOError(result)
+
+    def connect(self):
+        """
+        Opens a new autocommit connection in WAL mode (each is only used by one thread at a time via the pool)
+        :return: sqlite3 connection
+        """
+        db = sqlite3.connect(self.path, timeout=config.database_pool_config['TIMEOUT'], isolation_level=None,
+                             check_same_thread=False)
+        db.text_factory = str
+        if self.path != ':memory:':
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def execute_query(self, query, params=None, rowcount=False):
+        """
+        Executes given query, converting %s placeholders and binding non-text strings (binary game states) as BLOBs
+        """
+        query = query.replace('%s', '?')
+        if params:
+            params = tuple([buffer(p) if isinstance(p, str) and not isText(p) else p for p in params])
+        result = SQLBackend.execute_query(self, query, params, rowcount)
+        if rowcount or isinstance(result, basestring):
+            return result
+        return [tuple([str(value) if isinstance(value, buffer) else value for value in row]) for row in result]
+
+
+def isText(value):
+    """
+    :return: True if a str is plain ASCII text (game ids, str(dict) game states)
+    """
+    try:
+        value.decode('ascii')
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+class MemoryBackend(object):
+    """
+    Pure in-memory game state storage for tests and benchmarks - nothing is persisted and SQL isn't supported
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.games = collections.OrderedDict()  # game_id -> [row id, game state, version]
+        self.next_id = 1
+        self.reads = 0
+        self.writes = 0
+
+    def execute_query(self, query, params=None, rowcount=False):
+        raise NotImplementedError("The memory storage backend doesn't run SQL")
+
+    def get(self, game_id):
+        with self.lock:
+            self.reads += 1
+            row = self.games.get(game_id)
+            return row[1] if row != None else None
+
+    def get_row(self, game_id):
+        with self.lock:
+            self.reads += 1
+            row = self.games.get(game_id)
+            # No timestamps are kept in memory
+            return (row[0], game_id, row[1], row[2], None, None) if row != None else None
+
+    def upsert(self, game_id, game_state):
+        return self.upsert_many([(game_id, game_state)])
+
+    def upsert_many(self, rows):
+        with self.lock:
+            for game_id, game_state in rows:
+                self.writes += 1
+                row = self.games.get(game_id)
+                if row == None:
+                    self.games[game_id] = [self.next_id, game_state, 1]
+                    self.next_id += 1
+                else:
+                    row[1] = game_state
+                    row[2] += 1
+        return ()
+
+    def scan(self, after_id=0, limit=500):
+        with self.lock:
+            rows = [(row[0], game_id, row[1]) for game_id, row in self.games.iteritems() if row[0] > after_id]
+        return rows[:limit]
+
+    def check_schema(self):
+        pass
+
+    def stats(self):
+        with self.lock:
+            return {'games': len(self.games), 'reads': self.reads, 'writes': self.writes}
+
+    def close(self):
+        pass
+
+
+class BatchWriter(object):
+    """
+    Group commit for game state writes - concurrent writes are queued and a writer thread stores everything queued
+    within max_delay of the first write in one multi-row upsert, so many requests share one transaction
+    Each caller blocks until the batch holding its write has committed, so a write is never acknowledged early
+    """
+    def __init__(self, backend, max_delay=0.005, max_batch=100):
+        """
+        :param backend: Storage backend object (anything with upsert_many)
+        :param max_delay: Most seconds a write waits for others to join its batch
+        :param max_batch: Most games written per batch
+        """
+        assert max_batch > 0
+        self.backend = backend
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+
+        self.condition = threading.Condition(threading.Lock())
+        self.queue = []     # [[game_id, game_state, threading.Event, result]]
+        self.closed = False
+
+        # Metrics
+        self.batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.total_wait = 0.0
+
+        self.thread = threading.Thread(target=self.run, name="BatchWriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, game_id, game_state):
+        """
+        Queues a game state and waits for its batch to commit
+        :param game_id: str uuid4
+        :param game_state: str serialised game state
+        :return: Result of the batch's query (error string on failure)
+        """
+        request = [game_id, game_state, threading.Event(), None]
+        start = time.time()
+        with self.condition:
+            closed = self.closed
+            if not closed:
+                self.queue.append(request)
+                self.condition.notify()
+        if closed:
+            # Written directly, outside the lock so late writers don't queue behind each other's queries
+            return self.backend.upsert(game_id, game_state)
+        request[2].wait()
+        with self.condition:
+            self.total_wait += time.time() - start
+        return request[3]
+
+    def next_batch(self):
+        """
+        Waits for a write, then up to max_delay for others to join it
+        :return: List of queued requests, or None once closed with nothing left to write
+        """
+        with self.condition:
+            while not self.queue and not self.closed:
+                self.condition.wait()
+            if not self.queue:
+                return None
+
+            deadline = time.time() + self.max_delay
+            while len(self.queue) < self.max_batch and not self.closed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+            batch = self.queue[:self.max_batch]
+            del self.queue[:self.max_batch]
+            return batch
+
+    def run(self):
+        """
+        Writer thread - commits batches until closed and drained
+        :return: None
+        """
+        while True:
+            batch = self.next_batch()
+            if batch == None:
+                return
+            self.commit(batch)
+
+    def commit(self, batch):
+        """
+        Writes a batch in one upsert and wakes its callers
+        Repeated writes to the same game in a batch are coalesced, keeping the latest
+        :param batch: List of queued requests
+        :return: None
+        """
+        latest = collections.OrderedDict()
+        for game_id, game_state, done, result in batch:
+            latest[game_id] = game_state
+        try:
+            result = self.backend.upsert_many(latest.items())
+        except Exception, e:
+            result = "%s: %s" % (tools.get_formatted_datetime(), e)
+            tools.write_error("Batched game state write failed: %s" % result)
+
+        with self.condition:
+            self.batches += 1
+            self.writes += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+        for request in batch:
+            request[3] = result
+            request[2].set()
+
+    def close(self):
+        """
+        Writes anything queued and stops the writer thread - later writes go straight to the backend
+        :return: None
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def stats(self):
+        """
+        :return: Dict with batches committed, writes, mean and largest batch size and mean caller wait
+        """
+        with self.condition:
+            return {'batches': self.batches,
+                    'writes': self.writes,
+                    'mean_batch': self.writes / float(max(self.batches, 1)),
+                    'largest_batch': self.largest_batch,
+                    'mean_wait': self.total_wait / max(self.writes, 1)}
+
+
+BACKENDS = ['mysql', 'sqlite', 'memory']
+
+
+def create_backend(name=None, pool_size=None):
+    """
+    :param name: 'mysql', 'sqlite' or 'memory' (defaults to config.storage_backend)
+    :param pool_size: Most open connections for SQL backends (defaults to the CherryPy thread pool size)
+    :return: Storage backend object
+    """
+    if name == None:
+        name = config.storage_backend
+    if pool_size == None:
+        pool_size = config.cherrypy_config['global']['server.thread_pool']
+
+    if name == 'mysql':
+        return MySQLBackend(pool_size)
+    elif name == 'sqlite':
+        return SQLiteBackend(config.sqlite_config['PATH'], pool_size)
+    elif name == 'memory':
+        return MemoryBackend()
+    raise ValueError("Unknown storage backend '%s' (choose from %s)" % (name, ", ".join(BACKENDS)))